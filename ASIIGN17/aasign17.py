@@ -1,8 +1,11 @@
 import ast
 import json
 import time
-import requests
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_client  # shared pooled HTTP client at the repo root
 
 # ✅ CONFIGURATION
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
@@ -80,7 +83,7 @@ def call_openai_with_retries(messages, retries=3, backoff=2):
     }
     for attempt in range(retries):
         try:
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+            response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
             if response.status_code == 200:
                 return response.json()["choices"][0]["message"]["content"]
             else:
@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx  # Optional: only needed for HTTP/2 (pip install "httpx[http2]")
+except ImportError:
+    httpx = None
+
+# === CONFIGURATION ===
+# Every script talks to the same wrapper host, so one keep-alive pool is shared
+# by all of them instead of opening a new TCP+TLS connection per completion.
+POOL_SIZE = int(os.environ.get("API_POOL_SIZE", "10"))
+CONNECT_TIMEOUT = float(os.environ.get("API_CONNECT_TIMEOUT", "5"))  # seconds
+READ_TIMEOUT = float(os.environ.get("API_READ_TIMEOUT", "60"))  # seconds
+USE_HTTP2 = os.environ.get("API_HTTP2", "0") == "1"
+
+# Exceptions a caller should treat as a failed (retryable) request
+REQUEST_ERRORS = (requests.exceptions.RequestException,)
+if httpx is not None:
+    REQUEST_ERRORS += (httpx.HTTPError,)
+
+_client = None
+_executor = None
+_client_lock = threading.Lock()
+
+
+def configure(pool_size=None, connect_timeout=None, read_timeout=None, http2=None):
+    """Override the pool settings. The next request builds a fresh client."""
+    global POOL_SIZE, CONNECT_TIMEOUT, READ_TIMEOUT, USE_HTTP2
+    if pool_size is not None:
+        POOL_SIZE = pool_size
+    if connect_timeout is not None:
+        CONNECT_TIMEOUT = connect_timeout
+    if read_timeout is not None:
+        READ_TIMEOUT = read_timeout
+    if http2 is not None:
+        USE_HTTP2 = http2
+    close()
+
+
+def _build_client():
+    if USE_HTTP2 and httpx is not None:
+        try:
+            return httpx.Client(
+                http2=True,
+                limits=httpx.Limits(max_connections=POOL_SIZE, max_keepalive_connections=POOL_SIZE),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+        except ImportError:
+            pass  # httpx is installed without the 'h2' extra, fall back to HTTP/1.1
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_client():
+    """Return the shared client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+def post(url, headers=None, data=None, json=None, timeout=None):
+    """
+    POST through the shared keep-alive pool.
+
+    Drop-in replacement for requests.post(): the returned response supports
+    .status_code, .text, .json() and .raise_for_status(). `timeout` is the read
+    timeout in seconds; the connect timeout always comes from CONNECT_TIMEOUT.
+    """
+    client = get_client()
+    read_timeout = READ_TIMEOUT if timeout is None else timeout
+    if httpx is not None and isinstance(client, httpx.Client):
+        return client.post(url, headers=headers, content=data, json=json,
+                           timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT))
+    return client.post(url, headers=headers, data=data, json=json,
+                       timeout=(CONNECT_TIMEOUT, read_timeout))
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _client_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="api-client")
+    return _executor
+
+
+async def apost(url, headers=None, data=None, json=None, timeout=None):
+    """
+    Awaitable post(). Runs on a worker pool sized to POOL_SIZE so every
+    in-flight request gets its own pooled keep-alive connection.
+    """
+    return await arun(post, url, headers=headers, data=data, json=json, timeout=timeout)
+
+
+async def arun(func, *args, **kwargs):
+    """
+    Run a blocking call that uses the shared client on the same worker pool
+    as apost(). Cancelling the awaiting coroutine drops the call if it has
+    not started yet; once started it runs to completion in its thread.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def close():
+    """Close the shared client and drop its pooled connections."""
+    global _client, _executor
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
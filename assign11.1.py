@@ -1,6 +1,10 @@
 import json
-import requests
+import math
+import re
+import api_client
+import completion_cache
 import time
+from collections import Counter, defaultdict
 
 # ✅ API Setup
 API_URL_CHAT = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
@@ -25,13 +29,19 @@ FAQS = [
     }
 ]
 
-# ✅ Retry logic
+# ✅ Retry logic (temperature-0 payloads are answered from the completion cache when possible)
 def post_with_retry(url, payload, headers, retries=3, delay=2):
+    cache = completion_cache.default_cache()
+    cached = cache.get(payload)
+    if cached is not None:
+        return cached
     for attempt in range(retries):
         try:
-            response = requests.post(url, data=json.dumps(payload), headers=headers)
+            response = api_client.post(url, data=json.dumps(payload), headers=headers)
             response.raise_for_status()
-            return response.json()
+            data = response.json()
+            cache.put(payload, data)
+            return data
         except Exception as e:
             print(f"[Retry {attempt+1}] Error: {e}")
             time.sleep(delay)
@@ -55,12 +65,73 @@ def expand_query(user_query):
     data = post_with_retry(API_URL_CHAT, payload, HEADERS)
     return data['choices'][0]['message']['content'].strip()
 
-# ✅ Step 2: Retrieve most relevant FAQ using GPT
+# ✅ Local BM25 index over the FAQs (built once at startup)
+STOPWORDS = {"a", "an", "and", "are", "can", "do", "does", "for", "how", "i", "in", "is", "it",
+             "me", "my", "of", "on", "or", "the", "to", "what", "with", "you", "your"}
+SHORTLIST_SIZE = 3      # FAQs sent to the model when retrieval is not confident
+CONFIDENT_SCORE = 2.0   # Minimum BM25 score to answer without the model...
+CONFIDENT_MARGIN = 1.5  # ...when it also beats the runner-up by this factor
+
+def tokenize(text):
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", text.lower()):
+        if token in STOPWORDS:
+            continue
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]  # Crude plural folding: "emails" -> "email"
+        tokens.append(token)
+    return tokens
+
+class BM25Index:
+    """Okapi BM25 over an inverted index of term -> [(doc_id, term_freq)]."""
+    def __init__(self, documents, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for doc_id, text in enumerate(documents):
+            terms = Counter(tokenize(text))
+            self.doc_lengths.append(sum(terms.values()))
+            for term, freq in terms.items():
+                self.postings[term].append((doc_id, freq))
+        self.avg_length = sum(self.doc_lengths) / max(len(self.doc_lengths), 1)
+        n_docs = len(self.doc_lengths)
+        self.idf = {term: math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                    for term, docs in self.postings.items()}
+
+    def search(self, query, top_k=SHORTLIST_SIZE):
+        """Return [(doc_id, score)] for the best matching documents, best first."""
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for doc_id, freq in self.postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * freq * (self.k1 + 1) / (freq + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+FAQ_INDEX = BM25Index(f"{faq['question']} {faq['answer']}" for faq in FAQS)
+
+# ✅ Step 2: Retrieve most relevant FAQ (local short-list, model only breaks ties)
 def retrieve_faq(expanded_query):
+    candidates = FAQ_INDEX.search(expanded_query, top_k=SHORTLIST_SIZE)
+    if candidates:
+        best_id, best_score = candidates[0]
+        runner_up = candidates[1][1] if len(candidates) > 1 else 0.0
+        if best_score >= CONFIDENT_SCORE and best_score >= CONFIDENT_MARGIN * runner_up:
+            return FAQS[best_id]['question'], FAQS[best_id]['answer']
+
+    # Few or no words matched: let the model choose, topping the short-list up with the other FAQs
+    matched = {faq_id for faq_id, _ in candidates}
+    candidates += [(faq_id, 0.0) for faq_id in range(len(FAQS)) if faq_id not in matched]
+    candidates = candidates[:SHORTLIST_SIZE]
+
     prompt = f"User query: {expanded_query}\n\nChoose the most relevant FAQ from the list:\n"
-    for idx, faq in enumerate(FAQS):
+    for idx, (faq_id, _) in enumerate(candidates):
+        faq = FAQS[faq_id]
         prompt += f"\nFAQ {idx+1}:\nQ: {faq['question']}\nA: {faq['answer']}\n"
-    prompt += "\nRespond with the FAQ number (e.g., 1, 2, or 3) that best answers the user's query."
+    prompt += f"\nRespond with the FAQ number (1 to {len(candidates)}) that best answers the user's query."
 
     payload = {
         "model": "gpt-3.5-turbo",
@@ -76,9 +147,9 @@ def retrieve_faq(expanded_query):
     choice = data['choices'][0]['message']['content'].strip()
 
     try:
-        index = int(choice) - 1
-        return FAQS[index]['question'], FAQS[index]['answer']
-    except:
+        faq_id = candidates[int(choice) - 1][0]
+        return FAQS[faq_id]['question'], FAQS[faq_id]['answer']
+    except (ValueError, IndexError):
         raise ValueError(f"Invalid response from model: {choice}")
 
 # ✅ Step 3: Tailor the Final Answer
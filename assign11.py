@@ -1,4 +1,4 @@
-import requests
+import api_client
 import json
 import time
 
@@ -29,7 +29,7 @@ def call_openai_api(messages, max_tokens=MAX_TOKENS):
     }
     for attempt in range(MAX_RETRIES):
         try:
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+            response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
             response.raise_for_status()
             result = response.json()
             return result['choices'][0]['message']['content'].strip()
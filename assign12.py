@@ -1,9 +1,9 @@
-import requests
+import api_client
 import json
 import time
 import numpy as np
 from typing import List, Tuple
-from sklearn.metrics.pairwise import cosine_similarity
+from embedding_cache import EmbeddingCache
 
 # --- CONFIGURATION ---
 API_URL_CHAT = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
@@ -13,6 +13,8 @@ HEADERS = {
     'x-api-token': API_TOKEN,
     'Content-Type': 'application/json'
 }
+EMBEDDING_MODEL = "text-embedding-ada-002"
+EMBEDDING_CACHE = EmbeddingCache()
 
 # --- FAQ Data Store ---
 FAQS = [
@@ -34,10 +36,10 @@ FAQS = [
 def post_with_retry(url, payload, headers, max_retries=3, wait=2):
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, headers=headers, data=json.dumps(payload))
+            response = api_client.post(url, headers=headers, data=json.dumps(payload))
             response.raise_for_status()
             return response.json()
-        except requests.exceptions.RequestException as e:
+        except api_client.REQUEST_ERRORS as e:
             print(f"[Retry {attempt+1}] Error: {e}")
             time.sleep(wait)
     raise Exception("Max retries exceeded.")
@@ -56,29 +58,75 @@ def expand_query(user_query: str) -> str:
     data = post_with_retry(API_URL_CHAT, payload, HEADERS)
     return data['choices'][0]['message']['content'].strip()
 
-# --- Step 2: Embed Text ---
+# --- Step 2: Embed Text (cached on disk by content hash) ---
 def get_embedding(text: str) -> List[float]:
+    cached = EMBEDDING_CACHE.get(EMBEDDING_MODEL, text)
+    if cached is not None:
+        return cached.tolist()
+
     payload = {
-        "model": "text-embedding-ada-002",
+        "model": EMBEDDING_MODEL,
         "input": text
     }
     data = post_with_retry(API_URL_EMBED, payload, HEADERS)
-    return data['data'][0]['embedding']
+    embedding = data['data'][0]['embedding']
+    EMBEDDING_CACHE.put(EMBEDDING_MODEL, text, embedding)
+    return embedding
 
-# --- Step 3: Retrieve Most Relevant FAQ ---
-def retrieve_faq(expanded_query: str) -> Tuple[str, str]:
-    query_emb = np.array(get_embedding(expanded_query)).reshape(1, -1)
+def get_embeddings(texts: List[str], batch_size: int = 100) -> np.ndarray:
+    """Embed many texts, sending only cache misses to the API in batched requests."""
+    cached = EMBEDDING_CACHE.get_many(EMBEDDING_MODEL, texts)
+    missing = list(dict.fromkeys(text for text in texts if text not in cached))
+    for start in range(0, len(missing), batch_size):
+        batch = missing[start:start + batch_size]
+        data = post_with_retry(API_URL_EMBED, {"model": EMBEDDING_MODEL, "input": batch}, HEADERS)
+        fresh = {text: item['embedding'] for text, item in zip(batch, data['data'])}
+        EMBEDDING_CACHE.put_many(EMBEDDING_MODEL, fresh)
+        cached.update({text: np.asarray(vector, dtype=np.float32) for text, vector in fresh.items()})
+    return np.stack([cached[text] for text in texts]).astype(np.float32)
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize each row so a dot product is the cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+# Pre-normalized float32 matrix of FAQ question embeddings (one row per FAQ),
+# filled once by precompute_faq_embeddings()
+FAQ_MATRIX = np.empty((0, 0), dtype=np.float32)
 
-    best_score = -1
-    best_faq = None
+def precompute_faq_embeddings() -> None:
+    """Embed the whole FAQ store once; only questions missing from the cache hit the API."""
+    global FAQ_MATRIX
+    FAQ_MATRIX = normalize_rows(get_embeddings([faq["question"] for faq in FAQS]))
 
-    for faq in FAQS:
-        faq_emb = np.array(get_embedding(faq["question"])).reshape(1, -1)
-        score = cosine_similarity(query_emb, faq_emb)[0][0]
-        if score > best_score:
-            best_score = score
-            best_faq = faq
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """Indices of the top_k scores along the last axis, best first."""
+    top_k = min(top_k, scores.shape[-1])
+    candidates = np.argpartition(-scores, top_k - 1, axis=-1)[..., :top_k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=-1), axis=-1)
+    return np.take_along_axis(candidates, order, axis=-1)
 
+def score_faqs(query_embedding, top_k: int = 1) -> List[Tuple[int, float]]:
+    """Rank FAQs for one query with a single matrix-vector product."""
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query = query / (np.linalg.norm(query) or 1.0)
+    scores = FAQ_MATRIX @ query
+    return [(int(i), float(scores[i])) for i in top_k_indices(scores, top_k)]
+
+def score_faqs_batch(query_embeddings: np.ndarray, top_k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    """Rank FAQs for many queries at once; returns (indices, scores), both shaped (n_queries, top_k)."""
+    queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+    scores = queries @ FAQ_MATRIX.T
+    indices = top_k_indices(scores, top_k)
+    return indices, np.take_along_axis(scores, indices, axis=-1)
+
+# --- Step 3: Retrieve Most Relevant FAQ ---
+def retrieve_faq(expanded_query: str) -> Tuple[str, str]:
+    if FAQ_MATRIX.shape[0] != len(FAQS):
+        precompute_faq_embeddings()
+    best_index, _ = score_faqs(get_embedding(expanded_query), top_k=1)[0]
+    best_faq = FAQS[best_index]
     return best_faq["question"], best_faq["answer"]
 
 # --- Step 4: Generate Tailored Final Answer ---
@@ -105,6 +153,7 @@ Tailored Answer:
 
 # --- Main Workflow ---
 def main():
+    precompute_faq_embeddings()
     user_query = input("Enter your question: ").strip()
     expanded = expand_query(user_query)
     faq_q, faq_a = retrieve_faq(expanded)
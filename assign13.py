@@ -1,7 +1,22 @@
+import os
+import csv
 import json
-import requests
+import hashlib
+import queue
+import sqlite3
+import argparse
+import itertools
+import api_client
 import time
 import re
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+try:
+    import pyarrow  # Optional: only needed for ResultStream.arrow_batches (pip install pyarrow)
+except ImportError:
+    pyarrow = None
 
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
 HEADERS = {
@@ -9,19 +24,13 @@ HEADERS = {
     'Content-Type': 'application/json'
 }
 
-MOCK_SCHEMA = {
-    "Rentals": ["rental_id", "customer_id", "movie_id", "rental_date"],
-    "Customers": ["customer_id", "first_name", "last_name", "first_time"],
-    "Movies": ["movie_id", "title", "genre"]
-}
-
 MAX_RETRIES = 3
 
 
 def post_with_retry(payload):
     for attempt in range(1, MAX_RETRIES + 1):
         try:
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+            response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
             response.raise_for_status()
             return response.json()
         except Exception as e:
@@ -44,78 +53,673 @@ def chat_with_model(system_prompt, user_prompt):
     response = post_with_retry(payload)
     return response["choices"][0]["message"]["content"].strip()
 
-import sqlite3
-
-def simulate_query(refined_sql):
-    # Step 1: Create an in-memory SQLite database
-    conn = sqlite3.connect(':memory:')
-    cursor = conn.cursor()
+# === Sandbox databases ===
+SANDBOX_TEMPLATE = os.environ.get("SQL_SANDBOX_DB", "sql_sandbox.sqlite3")
+DATABASE = os.environ.get("SQL_DATABASE")  # A real database to query instead of the sandbox (read-only)
+SANDBOX_POOL_SIZE = 4
+TEMPLATE_VERSION = 1  # Bump when SANDBOX_DDL or MOCK_ROWS change so old templates are rebuilt
+SANDBOX_APPLICATION_ID = 0x53514C53  # PRAGMA application_id stamped on templates this module creates
 
-    # Step 2: Create tables
-    cursor.execute('''CREATE TABLE Customers (
+SANDBOX_DDL = [
+    '''CREATE TABLE Customers (
         customer_id INTEGER PRIMARY KEY,
         first_name TEXT,
         last_name TEXT,
         first_time BOOLEAN
-    )''')
-
-    cursor.execute('''CREATE TABLE Movies (
+    )''',
+    '''CREATE TABLE Movies (
         movie_id INTEGER PRIMARY KEY,
         title TEXT,
         genre TEXT
-    )''')
-
-    cursor.execute('''CREATE TABLE Rentals (
+    )''',
+    '''CREATE TABLE Rentals (
         rental_id INTEGER PRIMARY KEY,
         customer_id INTEGER,
         movie_id INTEGER,
         rental_date TEXT,
         FOREIGN KEY(customer_id) REFERENCES Customers(customer_id),
         FOREIGN KEY(movie_id) REFERENCES Movies(movie_id)
-    )''')
+    )''',
+]
 
-    # Step 3: Insert mock data
-    cursor.executemany("INSERT INTO Customers VALUES (?, ?, ?, ?)", [
+MOCK_ROWS = {
+    "Customers": [
         (1, 'Alice', 'Smith', True),
         (2, 'Bob', 'Jones', False),
         (3, 'Charlie', 'Lee', True),
-    ])
-
-    cursor.executemany("INSERT INTO Movies VALUES (?, ?, ?)", [
+    ],
+    "Movies": [
         (1, 'Inception', 'Sci-Fi'),
         (2, 'Titanic', 'Romance'),
         (3, 'The Matrix', 'Sci-Fi'),
-    ])
-
-    cursor.executemany("INSERT INTO Rentals VALUES (?, ?, ?, ?)", [
+    ],
+    "Rentals": [
         (1, 1, 1, '2024-12-01'),
         (2, 2, 2, '2024-11-01'),
         (3, 3, 3, '2025-04-10'),
-    ])
+    ],
+}
 
-    try:
-        # Step 4: Run the refined SQL
-        print("\nRunning SQL Query on mock DB...")
-        cursor.execute(refined_sql)
-        rows = cursor.fetchall()
-
-        print("\nQuery Result:")
-        if not rows:
-            print("No results found.")
+
+class SandboxPool:
+    """
+    Pool of databases to run generated SQL against.
+
+    The template file is created and seeded once (and kept across runs).
+    It is stamped with SANDBOX_APPLICATION_ID, and an existing file without
+    that stamp is never reset or written to. Queries borrow one of `size`
+    read-only connections to it, so nothing a query does can change the data
+    and no per-query setup is paid. Use `acquire(writable=True)` for a
+    private in-memory copy made with the SQLite backup API when a statement
+    has to write.
+
+    With `managed=False` the pool serves an existing database instead: it is
+    only ever opened read-only, and reset(), bulk_load() and create_indexes()
+    refuse to run.
+    """
+    def __init__(self, template_path=SANDBOX_TEMPLATE, size=SANDBOX_POOL_SIZE, managed=True):
+        self.template_path = template_path
+        self.size = size
+        self.managed = managed
+        self.catalog = SchemaCatalog(template_path)
+        self._idle = queue.LifoQueue()
+        if managed:
+            self._ensure_template()
+        elif not os.path.isfile(template_path):
+            raise ValueError(f"No database at {template_path}")
+
+    @property
+    def schema(self):
+        """{table: [column, ...]} of the database, read by the catalog."""
+        return self.catalog.columns()
+
+    def _check_managed(self, action):
+        if not self.managed:
+            raise ValueError(f"{self.template_path} is an existing database opened read-only; refusing to {action} it.")
+
+    def _ensure_template(self):
+        if not self._owns_template():
+            raise ValueError(f"{self.template_path} was not created by SandboxPool; refusing to overwrite it. "
+                             "Set SQL_SANDBOX_DB to a new file.")
+        if not os.path.exists(self.template_path) or self._pragma("user_version") != TEMPLATE_VERSION:
+            self.reset()
+
+    def _pragma(self, name):
+        conn = self._connect_readonly()
+        try:
+            return conn.execute(f"PRAGMA {name}").fetchone()[0]
+        finally:
+            conn.close()
+
+    def _owns_template(self):
+        """True if the template is missing, empty, or stamped as a sandbox by this module."""
+        if not os.path.exists(self.template_path) or os.path.getsize(self.template_path) == 0:
+            return True
+        try:
+            return self._pragma("application_id") == SANDBOX_APPLICATION_ID
+        except sqlite3.DatabaseError:
+            return False  # Not a SQLite file at all
+
+    def reset(self):
+        """Rebuild the template with the mock rows, dropping any bulk-loaded data."""
+        self._check_managed("reset")
+        if not self._owns_template():
+            raise ValueError(f"{self.template_path} was not created by SandboxPool; refusing to reset it.")
+        self.close()
+        if os.path.exists(self.template_path):
+            os.remove(self.template_path)
+        conn = sqlite3.connect(self.template_path)
+        try:
+            conn.execute(f"PRAGMA application_id = {SANDBOX_APPLICATION_ID}")
+            for ddl in SANDBOX_DDL:
+                conn.execute(ddl)
+            for table, rows in MOCK_ROWS.items():
+                placeholders = ", ".join("?" * len(rows[0]))
+                conn.executemany(f"INSERT INTO {table} VALUES ({placeholders})", rows)
+            conn.execute(f"PRAGMA user_version = {TEMPLATE_VERSION}")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def bulk_load(self, table, csv_path, batch_size=50000, replace=False):
+        """
+        Append rows from a CSV file (header row with column names) to a table
+        of the template, or with `replace` swap the table's rows (the mock
+        ones included) for the file's. Rows are streamed in batches inside one
+        transaction, so a failed load leaves the table as it was. Returns the
+        number of rows loaded.
+        """
+        self._check_managed("load data into")
+        schema = self.schema
+        if table not in schema:
+            raise ValueError(f"Unknown table {table!r}; choose from {', '.join(schema)}")
+        conn = sqlite3.connect(self.template_path)
+        loaded = 0
+        try:
+            # The template can be rebuilt from scratch, so skip durability while loading; the
+            # in-memory journal still lets a failed load roll back
+            conn.execute("PRAGMA journal_mode = MEMORY")
+            conn.execute("PRAGMA synchronous = OFF")
+            with open(csv_path, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                columns = next(reader, None)
+                if not columns:
+                    raise ValueError(f"{csv_path}: no header row")
+                unknown = set(columns) - set(schema[table])
+                if unknown:
+                    raise ValueError(f"{csv_path}: columns not in {table}: {', '.join(sorted(unknown))}")
+                insert = (f"INSERT INTO {table} ({', '.join(columns)}) "
+                          f"VALUES ({', '.join('?' * len(columns))})")
+                conn.execute("BEGIN")
+                if replace:
+                    conn.execute(f"DELETE FROM {table}")
+                while True:
+                    batch = list(itertools.islice(reader, batch_size))
+                    if not batch:
+                        break
+                    conn.executemany(insert, batch)
+                    loaded += len(batch)
+                conn.commit()
+            conn.execute("ANALYZE")  # Give the query planner real statistics
+        finally:
+            conn.close()
+        return loaded
+
+    @contextmanager
+    def acquire(self, writable=False):
+        """Borrow a connection: pooled read-only by default, a fresh in-memory copy if writable."""
+        if writable:
+            conn = sqlite3.connect(":memory:")
+            template = sqlite3.connect(self.template_path)
+            try:
+                template.backup(conn)
+            finally:
+                template.close()
+            try:
+                yield conn
+            finally:
+                conn.close()
+            return
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect_readonly()
+        try:
+            yield conn
+        finally:
+            if self._idle.qsize() < self.size:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def create_indexes(self, statements):
+        """Run CREATE INDEX statements on the template."""
+        self._check_managed("create indexes in")
+        conn = sqlite3.connect(self.template_path)
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("ANALYZE")
+            conn.commit()
+        finally:
+            conn.close()
+        # Idle connections may hold statements (EXPLAIN ones included) planned without the new indexes
+        self.close()
+
+    def _connect_readonly(self):
+        uri = f"file:{pathname2url(os.path.abspath(self.template_path))}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+_sandbox_pool = None
+
+def get_sandbox_pool():
+    """Process-wide pool over SQL_DATABASE if set (read-only), else over SANDBOX_TEMPLATE; built on first use."""
+    global _sandbox_pool
+    if _sandbox_pool is None:
+        _sandbox_pool = SandboxPool(DATABASE, managed=False) if DATABASE else SandboxPool()
+    return _sandbox_pool
+
+
+# === Schema catalog ===
+SCHEMA_CACHE = os.environ.get("SQL_SCHEMA_CACHE", "sql_schema_cache.json")
+MAX_SCHEMA_TABLES = 8  # Tables described in one prompt
+MAX_SCHEMA_CHARS = 4000  # Hard cap on the schema text in one prompt
+WORD = re.compile(r"[a-z0-9]+")
+
+SCHEMA_CACHE_FORMAT = 2  # Bump when SchemaTable changes so old cache entries are ignored
+
+# columns: column names, in table order
+# line: compact one-line description sent to the model, e.g. "Movies(movie_id INTEGER PK, title TEXT)"
+# terms: word stems of the table and column names, used to match questions
+# references: tables this one has foreign keys to
+SchemaTable = namedtuple("SchemaTable", ["name", "columns", "line", "terms", "references"])
+
+
+def stem(word):
+    """Crude suffix stripping so 'rented', 'rentals' and 'rental_date' all match 'rent'."""
+    for suffix in ("ies", "es", "s"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            word = word[:-len(suffix)] + ("y" if suffix == "ies" else "")
+            break
+    for suffix in ("ing", "ed", "al"):
+        if word.endswith(suffix) and len(word) > len(suffix) + 2:
+            return word[:-len(suffix)]
+    return word
+
+
+def name_terms(name):
+    return {stem(word) for word in WORD.findall(name.lower())}
+
+
+class SchemaCatalog:
+    """
+    Compact, cached description of the tables in a SQLite file.
+
+    The schema is read from sqlite_master and PRAGMA table_info / foreign_key_list
+    and serialized to one line per table. The serialization is kept in
+    `cache_path`, keyed by the database path and a hash of the definitions in
+    sqlite_master, so it is only rebuilt after the schema changes, including
+    when the file is replaced by another one. describe() picks the tables
+    whose names and columns share words with the question, so the schema part
+    of a prompt stays bounded however many tables the database has.
+    """
+    def __init__(self, db_path=SANDBOX_TEMPLATE, cache_path=SCHEMA_CACHE):
+        self.db_path = os.path.abspath(db_path)
+        self.cache_path = cache_path
+        self.version = None
+        self.tables = {}
+
+    def refresh(self):
+        """Reload the table descriptions if the schema changed since they were built."""
+        uri = f"file:{pathname2url(self.db_path)}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True)
+        try:
+            version = self._fingerprint(conn)
+            if version == self.version:
+                return self.tables
+            cached = self._read_cache().get(self.db_path)
+            if cached and cached.get("format") == SCHEMA_CACHE_FORMAT and cached["version"] == version:
+                tables = [SchemaTable(t["name"], t["columns"], t["line"], set(t["terms"]), t["references"])
+                          for t in cached["tables"]]
+            else:
+                tables = self._introspect(conn)
+                self._write_cache(version, tables)
+        finally:
+            conn.close()
+        self.version = version
+        self.tables = {table.name: table for table in tables}
+        return self.tables
+
+    def columns(self):
+        """{table: [column, ...]} for every table."""
+        return {name: table.columns for name, table in self.refresh().items()}
+
+    def describe(self, question, max_tables=MAX_SCHEMA_TABLES, max_chars=MAX_SCHEMA_CHARS):
+        """Schema text for the tables relevant to `question`, best matches first."""
+        tables = self.refresh()
+        words = name_terms(question)
+        scores = {}
+        for name, table in tables.items():
+            # A word matching the table name counts more than one matching a column
+            score = 2 * len(name_terms(name) & words) + len(table.terms & words)
+            if score:
+                scores[name] = score
+        chosen = sorted(scores, key=lambda name: -scores[name])[:max_tables]
+        if not chosen:
+            # Nothing matched: fall back to the first tables rather than an empty schema
+            chosen = list(tables)[:max_tables]
+
+        # Tables the chosen ones reference are needed to write the joins
+        for name in list(chosen):
+            for referenced in tables[name].references:
+                if referenced in tables and referenced not in chosen and len(chosen) < max_tables:
+                    chosen.append(referenced)
+
+        lines, size = [], 0
+        for name in chosen:
+            size += len(tables[name].line) + 1
+            if lines and size > max_chars:
+                break
+            lines.append(tables[name].line)
+        return "\n".join(lines)
+
+    @staticmethod
+    def _fingerprint(conn):
+        """Hash of every schema object's definition."""
+        # PRAGMA schema_version is not enough: a rebuilt file can reach the same number with other tables
+        rows = conn.execute("SELECT type, name, tbl_name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+        return hashlib.sha256(json.dumps(rows).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _introspect(conn):
+        tables = []
+        names = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+        )]
+        for name in names:
+            quoted = name.replace('"', '""')
+            foreign_keys = {row[3]: (row[2], row[4]) for row in conn.execute(f'PRAGMA foreign_key_list("{quoted}")')}
+            columns, descriptions, terms = [], [], name_terms(name)
+            for _, column, column_type, _, _, pk in conn.execute(f'PRAGMA table_info("{quoted}")'):
+                description = f"{column} {column_type}".strip() + (" PK" if pk else "")
+                if column in foreign_keys:
+                    description += " -> {}.{}".format(*foreign_keys[column])
+                columns.append(column)
+                descriptions.append(description)
+                terms |= name_terms(column)
+            references = sorted({table for table, _ in foreign_keys.values()})
+            tables.append(SchemaTable(name, columns, f"{name}({', '.join(descriptions)})", terms, references))
+        return tables
+
+    def _read_cache(self):
+        try:
+            with open(self.cache_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _write_cache(self, version, tables):
+        cache = self._read_cache()
+        cache[self.db_path] = {
+            "format": SCHEMA_CACHE_FORMAT,
+            "version": version,
+            "tables": [{"name": t.name, "columns": t.columns, "line": t.line, "terms": sorted(t.terms),
+                        "references": t.references} for t in tables],
+        }
+        try:
+            with open(self.cache_path, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+        except OSError as e:
+            print(f"Could not write the schema cache: {e}")
+
+
+# === Pre-execution cost guard ===
+QUERY_TIME_BUDGET = float(os.environ.get("SQL_TIME_BUDGET", "5"))  # seconds per sandbox query
+PROGRESS_CHECK_OPS = 10000  # SQLite VM instructions between budget checks
+MAX_RESULT_ROWS = int(os.environ.get("SQL_MAX_ROWS", "1000"))  # rows shown per sandbox query
+FETCH_BATCH_SIZE = 256  # rows fetched from the cursor at a time
+
+# plan: [(id, parent, detail)] from EXPLAIN QUERY PLAN
+# full_scans: tables read end to end; cartesian: True if unrestricted scans are nested
+# suggested_indexes: CREATE INDEX statements that would avoid the scans
+PlanReport = namedtuple("PlanReport", ["plan", "full_scans", "cartesian", "suggested_indexes"])
+
+PLAN_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$")
+PLAN_AUTOMATIC_INDEX = re.compile(r"^SEARCH (?:TABLE )?(\w+)(?: AS (\w+))? USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)")
+OPERAND = r"(?:(\w+)\.)?(\w+)|'(?:[^']|'')*'|[-+]?\d[\w.]*|\?"
+PREDICATE = re.compile(
+    rf"({OPERAND})\s*(=|<>|!=|<=|>=|<|>|\bIN\b|\bLIKE\b|\bBETWEEN\b|\bIS\b)\s*({OPERAND}|\()",
+    re.IGNORECASE,
+)
+EQUALITY_OPERATORS = {"=", "in", "is"}
+SQL_KEYWORDS = {"where", "join", "inner", "left", "right", "cross", "on", "group", "order", "limit", "natural", "using"}
+
+
+def table_aliases(sql, schema):
+    """Map every name a table of `schema` is referred to by in the query (its name or alias) to the table."""
+    aliases = {}
+    lowered = sql.lower()
+    for table in schema:
+        if table.lower() not in lowered:
+            continue  # Cheap pre-filter: most tables of a large schema are not in the query
+        for match in re.finditer(rf"\b{re.escape(table)}\b(?:\s+(?:AS\s+)?(\w+))?", sql, re.IGNORECASE):
+            aliases[table.lower()] = table
+            alias = match.group(1)
+            if alias and alias.lower() not in SQL_KEYWORDS:
+                aliases[alias.lower()] = table
+    return aliases
+
+
+def referenced_columns(sql, table, aliases, schema):
+    """Every column of `table` the query mentions, in order of first mention."""
+    columns = {column.lower(): column for column in schema[table]}
+    found = []
+    for qualifier, name in re.findall(r"(?:(\w+)\.)?(\w+)", sql):
+        if name.lower() not in columns or (qualifier and aliases.get(qualifier.lower()) != table):
+            continue
+        if columns[name.lower()] not in found:
+            found.append(columns[name.lower()])
+    return found
+
+
+def index_key_columns(sql, table, aliases, schema):
+    """
+    Columns of `table` worth leading an index with: those compared with a
+    constant (equality before range, as an index wants them), or if there
+    are none, its join columns so it can become the inner loop of the join.
+    """
+    columns = {column.lower(): column for column in schema[table]}
+    all_columns = {column.lower() for name in set(aliases.values()) for column in schema[name]}
+
+    def own_column(qualifier, name):
+        if not name or name.lower() not in columns:
+            return None
+        if qualifier and aliases.get(qualifier.lower()) != table:
+            return None
+        return columns[name.lower()]
+
+    equality, ranges, joins = [], [], []
+    for m in PREDICATE.finditer(sql):
+        left_qualifier, left_name, operator, right_qualifier, right_name = m.group(2, 3, 4, 6, 7)
+        for qualifier, name, other_name in ((left_qualifier, left_name, right_name),
+                                            (right_qualifier, right_name, left_name)):
+            column = own_column(qualifier, name)
+            if column is None:
+                continue
+            if other_name and other_name.lower() in all_columns:
+                target = joins
+            elif operator.lower() in EQUALITY_OPERATORS:
+                target = equality
+            else:
+                target = ranges
+            if column not in target:
+                target.append(column)
+    keys = [c for c in equality] + [c for c in ranges if c not in equality]
+    return keys or joins
+
+
+def suggest_index(sql, table, aliases, schema, key_columns=None):
+    """CREATE INDEX for the table's predicate columns, extended to cover every column the query reads."""
+    keys = key_columns or index_key_columns(sql, table, aliases, schema)
+    if not keys:
+        return None
+    covering = list(keys)
+    if not re.search(r"(?:^|[\s,(])\*", sql):
+        covering += [c for c in referenced_columns(sql, table, aliases, schema) if c not in covering]
+    name = f"idx_{table}_{'_'.join(covering)}".lower()
+    return f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(covering)})"
+
+
+def check_query_plan(sql, pool=None):
+    """
+    Run EXPLAIN QUERY PLAN for the query on the sandbox and report full
+    table scans, cartesian joins and indexes that would avoid them.
+    Raises sqlite3.Error if the query does not compile.
+    """
+    pool = pool or get_sandbox_pool()
+    with pool.acquire() as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+
+    schema = pool.schema
+    aliases = table_aliases(sql, schema)
+    full_scans = []
+    scans_per_loop = {}
+    suggestions = []
+    for node_id, parent, _, detail in plan:
+        scan = PLAN_SCAN.match(detail)
+        automatic = PLAN_AUTOMATIC_INDEX.match(detail)
+        if scan and "INDEX" not in scan.group(3):
+            table = aliases.get((scan.group(2) or scan.group(1)).lower()) or aliases.get(scan.group(1).lower())
+            if table is None:
+                continue  # Subquery or CTE, not a real table
+            full_scans.append(table)
+            scans_per_loop[parent] = scans_per_loop.get(parent, 0) + 1
+            suggestion = suggest_index(sql, table, aliases, schema)
+        elif automatic:
+            # SQLite builds a throwaway index for every execution; a real one is cheaper
+            table = aliases.get((automatic.group(2) or automatic.group(1)).lower())
+            if table is None:
+                continue
+            keys = [c.split("=")[0].strip() for c in automatic.group(3).split(" AND ")]
+            suggestion = suggest_index(sql, table, aliases, schema, [c for c in keys if c in schema[table]])
         else:
-            for row in rows:
-                print(row)
+            continue
+        if suggestion and suggestion not in suggestions:
+            suggestions.append(suggestion)
 
-    except sqlite3.Error as e:
-        print("\nSQLite Error:", e)
+    cartesian = any(count > 1 for count in scans_per_loop.values())
+    return PlanReport([tuple(row[:2]) + (row[3],) for row in plan], full_scans, cartesian, suggestions)
 
+
+@contextmanager
+def time_budget(conn, seconds=QUERY_TIME_BUDGET):
+    """Abort any statement on `conn` that runs longer than `seconds` (raises sqlite3.OperationalError)."""
+    deadline = time.monotonic() + seconds
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, PROGRESS_CHECK_OPS)
+    try:
+        yield
     finally:
-        conn.close()
+        conn.set_progress_handler(None, PROGRESS_CHECK_OPS)
+
+
+class ResultStream:
+    """
+    Rows of an executed cursor, fetched `batch_size` at a time with fetchmany.
+
+    At most `max_rows` rows are produced; `truncated` is set once the stream
+    stops early because more rows were available. Only one batch is held in
+    memory, however large the result set is. A stream can be consumed once.
+    """
+    def __init__(self, cursor, batch_size=FETCH_BATCH_SIZE, max_rows=MAX_RESULT_ROWS):
+        self.cursor = cursor
+        self.batch_size = batch_size
+        self.max_rows = max_rows
+        self.columns = [column[0] for column in cursor.description or ()]
+        self.row_count = 0
+        self.truncated = False
+
+    def batches(self):
+        """Yield lists of at most batch_size rows."""
+        while self.row_count < self.max_rows:
+            batch = self.cursor.fetchmany(min(self.batch_size, self.max_rows - self.row_count))
+            if not batch:
+                return
+            self.row_count += len(batch)
+            yield batch
+        # The cap was reached: one more row means the result was cut short
+        self.truncated = self.cursor.fetchone() is not None
+
+    def __iter__(self):
+        for batch in self.batches():
+            yield from batch
+
+    def arrow_batches(self):
+        """Yield the same batches as columnar pyarrow.RecordBatch objects."""
+        if pyarrow is None:
+            raise ImportError("ResultStream.arrow_batches requires pyarrow (pip install pyarrow)")
+        for batch in self.batches():
+            yield pyarrow.record_batch([pyarrow.array(list(values)) for values in zip(*batch)], names=self.columns)
+
+
+def simulate_query(refined_sql, pool=None, budget=QUERY_TIME_BUDGET, max_rows=MAX_RESULT_ROWS):
+    pool = pool or get_sandbox_pool()
+    with pool.acquire() as conn:
+        cursor = conn.cursor()
+        try:
+            # Run the refined SQL on a pooled connection to the pre-seeded sandbox
+            print(f"\nRunning SQL Query on {'mock DB' if pool.managed else pool.template_path}...")
+            with time_budget(conn, budget):
+                cursor.execute(refined_sql)
+                results = ResultStream(cursor, max_rows=max_rows)
+
+                # Rows are printed as they are fetched, so the budget also covers producing them
+                print("\nQuery Result:")
+                for row in results:
+                    print(row)
+
+            if results.row_count == 0:
+                print("No results found.")
+            elif results.truncated:
+                print(f"... output truncated after {results.row_count} rows.")
+
+        except sqlite3.OperationalError as e:
+            if str(e) == "interrupted":
+                print(f"\nQuery aborted: exceeded the {budget:g}s time budget.")
+            else:
+                print("\nSQLite Error:", e)
+        except sqlite3.Error as e:
+            print("\nSQLite Error:", e)
+
+        finally:
+            cursor.close()
+
+
+# === Local validation ===
+MAX_REFINE_ROUNDS = 2  # Model refine calls allowed after a failed validation
+SQL_LITERAL_OR_COMMENT = re.compile(r"'(?:[^']|'')*'|--[^\n]*|/\*.*?(?:\*/|$)", re.DOTALL)
+# Authorizer actions a query may perform; anything else (writes, ATTACH, PRAGMA, ...) is denied
+READ_ONLY_ACTIONS = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+
+
+def _read_only_authorizer(action, *_):
+    return sqlite3.SQLITE_OK if action in READ_ONLY_ACTIONS else sqlite3.SQLITE_DENY
+
+
+def validate_sql(sql, pool=None):
+    """
+    Check a candidate query locally, without running it. Returns None if it
+    is valid, else the error message to hand back to the model.
+    """
+    # String literals and comments are blanked so text like 'a.b' in them is not mistaken for a column
+    code = SQL_LITERAL_OR_COMMENT.sub(lambda m: "''" if m.group().startswith("'") else " ", sql)
+    if not code.strip(" \n\t;"):
+        return "The response contained no SQL query."
+
+    # Qualified columns (alias.column) must belong to the table the alias stands for
+    pool = pool or get_sandbox_pool()
+    schema = pool.schema
+    aliases = table_aliases(code, schema)
+    for qualifier, column in re.findall(r"\b(\w+)\.(\w+)\b", code):
+        table = aliases.get(qualifier.lower())
+        if table and column != "*" and column.lower() not in {c.lower() for c in schema[table]}:
+            return f"No column {column} in table {table}. Its columns are: {', '.join(schema[table])}."
+
+    # Compiling the statement checks syntax and every table and column name against the real
+    # schema; the authorizer sees every action the statement would take and rejects writes
+    with pool.acquire() as conn:
+        conn.set_authorizer(_read_only_authorizer)
+        try:
+            conn.execute(f"EXPLAIN {sql}")
+        except sqlite3.DatabaseError as e:
+            if str(e) == "not authorized":
+                return "Only a single read-only SELECT query is allowed."
+            return f"SQLite error: {e}"
+        except (sqlite3.Error, sqlite3.Warning) as e:
+            return f"SQLite error: {e}"
+        finally:
+            conn.set_authorizer(None)
+    return None
+
+
 def clean_sql(sql: str) -> str:
     """
     Extracts and returns only the actual SQL query from the model's response.
     Ensures no commentary or markdown formatting remains.
     """
+    # Keep only the first fenced code block if the model wrapped the query in prose
+    fenced = re.search(r"```(?:sql)?\s*(.*?)```", sql, re.DOTALL | re.IGNORECASE)
+    if fenced:
+        sql = fenced.group(1)
+
     # Remove markdown code block markers
     sql = sql.replace("```sql", "").replace("```", "").strip()
 
@@ -131,11 +735,45 @@ def clean_sql(sql: str) -> str:
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate SQLite queries from natural language and try them on a sandbox.")
+    parser.add_argument("--load", nargs=2, action="append", default=[], metavar=("TABLE", "CSV"),
+                        help="bulk-load a CSV file into a sandbox table before asking (repeatable)")
+    parser.add_argument("--replace", action="store_true",
+                        help="make --load replace the table's existing rows (the mock ones included) instead of appending")
+    parser.add_argument("--reset-sandbox", action="store_true", help="rebuild the sandbox with only the mock rows")
+    parser.add_argument("--database", default=DATABASE,
+                        help="query this existing SQLite file (read-only) instead of the sandbox")
+    parser.add_argument("--max-rows", type=int, default=MAX_RESULT_ROWS, help="stop printing results after this many rows")
+    parser.add_argument("--auto-index", action="store_true",
+                        help="create the suggested indexes in the sandbox before running the query")
+    args = parser.parse_args()
+    if args.database and (args.load or args.reset_sandbox):
+        parser.error("--load and --reset-sandbox only apply to the sandbox, not to --database")
+
+    try:
+        pool = SandboxPool(args.database, managed=False) if args.database else get_sandbox_pool()
+    except ValueError as e:
+        print("Error:", e)
+        return
+    if args.reset_sandbox:
+        pool.reset()
+    replaced = set()
+    for table, csv_path in args.load:
+        start = time.perf_counter()
+        try:
+            # With --replace, a table's old rows go before its first CSV; later ones for it append
+            loaded = pool.bulk_load(table, csv_path, replace=args.replace and table not in replaced)
+        except (ValueError, OSError, sqlite3.Error) as e:
+            print(f"Error loading {csv_path} into {table}: {e}")
+            return
+        replaced.add(table)
+        print(f"Loaded {loaded} rows into {table} in {time.perf_counter() - start:.2f}s")
+
     # Step 1: Accept user question
     question = input("Enter your natural language question: ")
 
-    # Step 2: Prepare mock schema
-    schema_str = "\n".join([f"Table: {table}\nColumns: {', '.join(cols)}" for table, cols in MOCK_SCHEMA.items()])
+    # Step 2: Describe only the tables relevant to the question
+    schema_str = pool.catalog.describe(question)
 
     # Step 3: Generate SQL
     system_prompt_gen = "You are an expert database assistant. You will generate SQLite queries based on user questions and provided schema."
@@ -144,20 +782,48 @@ def main():
     initial_sql = chat_with_model(system_prompt_gen, user_prompt_gen)
     print("\nInitial SQL Generated:\n", initial_sql)
 
-    # Step 4: Refine SQL
+    # Step 4: Clean SQL and validate it locally; refine with the model only if that fails
+    cleaned_sql = clean_sql(initial_sql)
+    error = validate_sql(cleaned_sql, pool)
     system_prompt_refine = "You are a senior database engineer. Refine or correct any issues in the SQL query based on the schema."
-    user_prompt_refine = f"Schema:\n{schema_str}\n\nInitial SQL:\n{initial_sql}\n\nRefine this SQL query."
+    for _ in range(MAX_REFINE_ROUNDS):
+        if error is None:
+            break
+        print("\nValidation failed:", error)
+        user_prompt_refine = (f"Schema:\n{schema_str}\n\nInitial SQL:\n{cleaned_sql or initial_sql}\n\n"
+                              f"Validation error:\n{error}\n\nFix this SQL query. Reply with the SQL query only.")
+
+        refined_sql = chat_with_model(system_prompt_refine, user_prompt_refine)
+        print("\nRefined SQL from model:\n", refined_sql)
 
-    refined_sql = chat_with_model(system_prompt_refine, user_prompt_refine)
+        cleaned_sql = clean_sql(refined_sql)
+        error = validate_sql(cleaned_sql, pool)
 
-    print("\nRefined SQL from model:\n", refined_sql)
+    if error is not None:
+        print("\nCould not get a valid query:", error)
+        return
+    print("\nValidated SQL to run:\n", cleaned_sql)
 
-    # Step 5: Clean SQL to ensure it runs on SQLite
-    cleaned_sql = clean_sql(refined_sql)
-    print("\nCleaned SQL to run:\n", cleaned_sql)
+    # Step 5: Check the query plan before running anything
+    try:
+        report = check_query_plan(cleaned_sql, pool)
+    except sqlite3.Error as e:
+        print("\nSQLite Error:", e)
+        return
+    for table in report.full_scans:
+        print(f"\nWarning: full scan of {table}")
+    if report.cartesian:
+        print("\nWarning: cartesian join (nested full scans with no join condition narrowing them)")
+    if report.suggested_indexes:
+        print("\nSuggested indexes:\n" + "\n".join(report.suggested_indexes))
+        if args.auto_index and not pool.managed:
+            print("Not creating indexes: --database is opened read-only.")
+        elif args.auto_index:
+            pool.create_indexes(report.suggested_indexes)
+            print("Created the suggested indexes in the sandbox.")
 
     # Step 6: Simulate the query on a mock database
-    simulate_query(cleaned_sql)
+    simulate_query(cleaned_sql, pool, max_rows=args.max_rows)
 
 
 if __name__ == "__main__":
@@ -1,5 +1,5 @@
 import json
-import requests
+import api_client
 
 # Step 1: Query vector store (example function)
 def query_vector_store(user_input: str):
@@ -22,7 +22,7 @@ def call_model(prompt: str):
         "model": "gpt-4",
         "max_tokens": 4096
     })
-    response = requests.post(API_URL, data=payload, headers=headers)
+    response = api_client.post(API_URL, data=payload, headers=headers)
     response.raise_for_status()
     return response.json()['choices'][0]['message']['content']
 
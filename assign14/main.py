@@ -83,55 +83,160 @@
 #     print(final_code)
 
 import os
+import sys
 import json
-import requests
+import time
+import hashlib
+import argparse
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from sklearn.neighbors import NearestNeighbors
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_client  # shared pooled HTTP client at the repo root
 
 # === CONFIGURATION ===
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
 API_KEY = "YOUR_API_KEY"  # Replace with your key
 SNIPPET_DIR = "snippets"
-EMBEDDING_MODEL = SentenceTransformer("all-MiniLM-L6-v2")
-
-# === STEP 1: LOAD & EMBED CODE SNIPPETS ===
-def load_snippets():
-    print("Looking in:", os.path.abspath(SNIPPET_DIR))
-    if not os.path.exists(SNIPPET_DIR):
-        print("❌ 'snippets' folder not found!")
-        return [], []
-    
-    snippets = []
-    filenames = []
-    for fname in os.listdir(SNIPPET_DIR):
-        path = os.path.join(SNIPPET_DIR, fname)
-        if not fname.endswith((".py", ".txt")):
-            continue  # Skip non-code files
-        with open(path, "r") as f:
-            code = f.read()
-            if code.strip():  # Ignore empty files
-                snippets.append(code)
-                filenames.append(fname)
-                print("✅ Loaded:", fname)
-            else:
+SNIPPET_CACHE_FILE = "snippet_embeddings.npz"  # Embeddings cached across runs
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch" (default), "onnx" or "onnx-int8" (quantized CPU inference, needs sentence-transformers[onnx])
+EMBEDDING_BACKEND = os.environ.get("EMBEDDING_BACKEND", "torch")
+# Quantized export shipped in the model repo. The avx2 one runs on any x86-64 CPU; pick e.g.
+# onnx/model_qint8_avx512_vnni.onnx or onnx/model_qint8_arm64.onnx to match the machine
+ONNX_INT8_FILE = os.environ.get("EMBEDDING_ONNX_INT8_FILE", "onnx/model_quint8_avx2.onnx")
+
+# === EMBEDDING MODEL (loaded lazily, torch import included) ===
+_embedding_model = None
+_embedding_model_lock = threading.Lock()
+
+def load_embedding_model(backend=None):
+    """Build a fresh encoder for the given backend. Slow: imports torch/onnxruntime and loads weights."""
+    from sentence_transformers import SentenceTransformer
+
+    backend = backend or EMBEDDING_BACKEND
+    if backend == "torch":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME)
+    if backend == "onnx":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx")
+    if backend == "onnx-int8":
+        return SentenceTransformer(EMBEDDING_MODEL_NAME, backend="onnx", model_kwargs={"file_name": ONNX_INT8_FILE})
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+def get_embedding_model():
+    """Return the shared encoder, loading it on first use (or waiting for warm_embedding_model)."""
+    global _embedding_model
+    if _embedding_model is None:
+        with _embedding_model_lock:
+            if _embedding_model is None:
+                _embedding_model = load_embedding_model()
+    return _embedding_model
+
+def warm_embedding_model():
+    """Start loading the encoder in a background thread so it overlaps with other startup work."""
+    thread = threading.Thread(target=get_embedding_model, name="warm-embedding-model", daemon=True)
+    thread.start()
+    return thread
+
+def embedding_model_key():
+    """Identifies which encoder produced cached embeddings; different backends don't mix."""
+    if EMBEDDING_BACKEND == "onnx-int8":
+        # Each quantized export rounds differently, so its vectors are cached separately
+        return f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}:{ONNX_INT8_FILE}"
+    return f"{EMBEDDING_MODEL_NAME}:{EMBEDDING_BACKEND}"
+
+# === STEP 1 & 2: LOAD, EMBED AND RETRIEVE CODE SNIPPETS ===
+class SnippetRetriever:
+    """
+    Keeps snippet embeddings and a fitted NearestNeighbors model across queries.
+
+    Embeddings are cached on disk keyed by file path, mtime, size and content
+    hash, so refresh() only re-encodes snippets that are new or changed.
+    """
+    def __init__(self, snippet_dir=SNIPPET_DIR, cache_file=SNIPPET_CACHE_FILE):
+        self.snippet_dir = snippet_dir
+        self.cache_file = cache_file
+        self.records = []  # [{"path", "mtime_ns", "size", "sha256"}], row-aligned with self.embeddings
+        self.embeddings = np.empty((0, 0), dtype=np.float32)
+        self.nn = None
+        self.refresh()
+
+    def _load_cache(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with np.load(self.cache_file) as data:
+                meta = json.loads(str(data["meta"]))
+                if meta["model"] != embedding_model_key():
+                    return {}
+                return {record["path"]: (record, row) for record, row in zip(meta["records"], data["embeddings"])}
+        except Exception as e:
+            print("⚠️ Ignoring unreadable embedding cache:", e)
+            return {}
+
+    def _save_cache(self):
+        meta = json.dumps({"model": embedding_model_key(), "records": self.records})
+        np.savez(self.cache_file, embeddings=self.embeddings, meta=np.array(meta))
+
+    def refresh(self):
+        """Sync with SNIPPET_DIR: re-embed only new or changed files, then refit once."""
+        print("Looking in:", os.path.abspath(self.snippet_dir))
+        if not os.path.exists(self.snippet_dir):
+            print("❌ 'snippets' folder not found!")
+            return
+
+        cached = self._load_cache()
+        records, rows, to_embed = [], [], []
+        for fname in sorted(os.listdir(self.snippet_dir)):
+            path = os.path.join(self.snippet_dir, fname)
+            if not fname.endswith((".py", ".txt")):
+                continue  # Skip non-code files
+            stat = os.stat(path)
+            record = {"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": None}
+            hit = cached.get(path)
+            if hit and hit[0]["mtime_ns"] == stat.st_mtime_ns and hit[0]["size"] == stat.st_size:
+                records.append(hit[0])
+                rows.append(hit[1])
+                continue
+
+            with open(path, "r") as f:
+                code = f.read()
+            if not code.strip():  # Ignore empty files
                 print("⚠️ Skipped empty file:", fname)
-    
-    print(f"\nTotal loaded: {len(snippets)}\n")
-    return snippets, filenames
+                continue
+            record["sha256"] = hashlib.sha256(code.encode("utf-8")).hexdigest()
+            if hit and hit[0]["sha256"] == record["sha256"]:
+                rows.append(hit[1])  # Touched but unchanged
+            else:
+                rows.append(None)
+                to_embed.append((len(rows) - 1, code))
+                print("✅ Embedding:", fname)
+            records.append(record)
 
+        if to_embed:
+            fresh = get_embedding_model().encode([code for _, code in to_embed])
+            for (row, _), embedding in zip(to_embed, fresh):
+                rows[row] = embedding
 
-def embed_snippets(snippets):
-    embeddings = EMBEDDING_MODEL.encode(snippets)
-    return np.array(embeddings)
+        self.records = records
+        self.embeddings = np.array(rows, dtype=np.float32) if rows else np.empty((0, 0), dtype=np.float32)
+        if records != [record for record, _ in cached.values()]:
+            self._save_cache()
+        from sklearn.neighbors import NearestNeighbors
+        self.nn = NearestNeighbors(metric='cosine').fit(self.embeddings) if rows else None
+        print(f"\nTotal loaded: {len(records)} (re-embedded {len(to_embed)})\n")
 
-# === STEP 2: RETRIEVE SIMILAR SNIPPETS ===
-def retrieve_relevant_snippets(user_prompt, snippets, snippet_embeddings, top_k=2):
-    query_embedding = EMBEDDING_MODEL.encode([user_prompt])
-    nn = NearestNeighbors(n_neighbors=top_k, metric='cosine')
-    nn.fit(snippet_embeddings)
-    distances, indices = nn.kneighbors(query_embedding)
-    return [snippets[i] for i in indices[0]]
+    def retrieve(self, user_prompt, top_k=2):
+        """Return the contents of the top_k snippets most similar to the prompt."""
+        if self.nn is None:
+            return []
+        query_embedding = get_embedding_model().encode([user_prompt])
+        distances, indices = self.nn.kneighbors(query_embedding, n_neighbors=min(top_k, len(self.records)))
+        snippets = []
+        for i in indices[0]:
+            with open(self.records[i]["path"], "r") as f:
+                snippets.append(f.read())
+        return snippets
 
 # === STEP 3: CALL OPENAI WRAPPER ===
 def call_model(system_prompt, user_prompt):
@@ -148,23 +253,67 @@ def call_model(system_prompt, user_prompt):
         "max_tokens": 1024
     })
     try:
-        response = requests.post(API_URL, data=payload, headers=headers)
+        response = api_client.post(API_URL, data=payload, headers=headers)
         response.raise_for_status()
         return response.json()["choices"][0]["message"]["content"]
     except Exception as e:
         print("Error calling API:", e)
         return ""
 
+# === BENCHMARK: STARTUP AND THROUGHPUT PER BACKEND ===
+def benchmark_backends(backends, texts, repeats=5):
+    """Print model load time and encode throughput for each backend on the same texts."""
+    start = time.perf_counter()
+    import sentence_transformers  # noqa: F401  (torch import cost, paid once by whichever backend loads first)
+    print(f"{'import':<10} {time.perf_counter() - start:8.2f}s")
+    for backend in backends:
+        try:
+            start = time.perf_counter()
+            model = load_embedding_model(backend)
+            load_seconds = time.perf_counter() - start
+            model.encode(texts[:1])  # Warm-up
+            start = time.perf_counter()
+            for _ in range(repeats):
+                model.encode(texts)
+            throughput = repeats * len(texts) / (time.perf_counter() - start)
+            print(f"{backend:<10} load {load_seconds:6.2f}s   encode {throughput:8.1f} texts/s")
+        except Exception as e:
+            print(f"{backend:<10} unavailable: {e}")
+
 # === MAIN FLOW ===
 if __name__ == "__main__":
-    user_input = input("Describe your coding requirement:\n")
+    parser = argparse.ArgumentParser(description="Generate and refactor code using retrieved snippets.")
+    parser.add_argument("--backend", choices=["torch", "onnx", "onnx-int8"], default=EMBEDDING_BACKEND,
+                        help="Embedding inference backend (default: %(default)s)")
+    parser.add_argument("--onnx-int8-file", default=ONNX_INT8_FILE,
+                        help="Quantized ONNX file in the model repo for --backend onnx-int8 (default: %(default)s)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Compare startup time and throughput of every backend on the snippets, then exit")
+    args = parser.parse_args()
+    EMBEDDING_BACKEND = args.backend
+    ONNX_INT8_FILE = args.onnx_int8_file
+
+    if args.benchmark:
+        if not os.path.exists(SNIPPET_DIR):
+            sys.exit("❌ 'snippets' folder not found!")
+        texts = []
+        for fname in sorted(os.listdir(SNIPPET_DIR)):
+            if fname.endswith((".py", ".txt")):
+                with open(os.path.join(SNIPPET_DIR, fname), "r") as f:
+                    texts.append(f.read())
+        benchmark_backends(["torch", "onnx", "onnx-int8"], texts * 16)
+        sys.exit(0)
 
-    # Step 1: Load and embed code snippets
-    snippets, filenames = load_snippets()
-    snippet_embeddings = embed_snippets(snippets)
+    # Load the encoder in the background while snippets load from disk and the user types
+    warm_embedding_model()
+
+    # Step 1: Load snippets, embedding only new or changed files
+    retriever = SnippetRetriever()
+
+    user_input = input("Describe your coding requirement:\n")
 
     # Step 2: Retrieve top matching snippets
-    retrieved_snippets = retrieve_relevant_snippets(user_input, snippets, snippet_embeddings)
+    retrieved_snippets = retriever.retrieve(user_input)
 
     # Step 3: Generate initial boilerplate
     system_prompt_1 = "You're a code generator. Use best practices and the following code references to build a solution."
@@ -183,6 +332,7 @@ if __name__ == "__main__":
     print(final_code)
     
 # pip install sentence-transformers scikit-learn numpy requests
+# pip install "sentence-transformers[onnx]"  # only for --backend onnx / onnx-int8
 
 # Make a FastAPI endpoint that allows a user to upload a file and saves it to disk.
 # Create a function to send an email with both HTML and plain text support using Python.
\ No newline at end of file
@@ -1,5 +1,5 @@
 import json
-import requests
+import api_client
 import subprocess
 import os
 
@@ -27,7 +27,7 @@ def call_model(system_prompt, user_prompt):
         "presence_penalty": 0
     })
     try:
-        response = requests.post(API_URL, data=payload, headers=headers)
+        response = api_client.post(API_URL, data=payload, headers=headers)
         response.raise_for_status()
         return response.json()["choices"][0]["message"]["content"]
     except Exception as e:
@@ -1,5 +1,5 @@
 import json
-import requests
+import api_client
 
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
 
@@ -16,7 +16,7 @@ def call_model(system_prompt, user_prompt):
         "model": "gpt-4",
         "max_tokens": 4096
     })
-    response = requests.post(API_URL, data=payload, headers=headers)
+    response = api_client.post(API_URL, data=payload, headers=headers)
     response.raise_for_status()
     return response.json()['choices'][0]['message']['content']
 
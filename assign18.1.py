@@ -1,10 +1,15 @@
 import os
-import fitz  # PyMuPDF
-import requests
+import asyncio
+import pdf_cache
+import completion_cache
+from semantic_cache import SemanticCache, folder_version, make_api_embedder
+import api_client
+from doc_chunks import ChunkStore, iter_chunks, page_label
 import json
 import time
 
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
+API_URL_EMBED = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/embeddings/"
 API_TOKEN = "your-api-token-here"  # Replace this with your actual token
 
 HEADERS = {
@@ -12,27 +17,45 @@ HEADERS = {
     'Content-Type': 'application/json'
 }
 
+NO_INFO_ANSWER = "I don't have this information"
+FAILED_ANSWER = "Failed to get a response from the model."
+MAX_CONCURRENT_REQUESTS = api_client.POOL_SIZE  # In-flight chunk prompts per question
+ANSWERS_NEEDED = 3  # Stop asking once this many chunks have answered
+CHUNK_TOKENS = 500          # cl100k_base tokens per chunk
+CHUNK_OVERLAP_TOKENS = 50   # Tokens repeated from the end of the previous chunk
+CHUNK_STORE = ChunkStore()
+
+# (chunk id, question) -> answer, so a repeated question skips chunks already asked
+ANSWER_MEMO = {}
+
 def load_documents(doc_folder="docs"):
+    """Return [(filename, ExtractedPdf)] for every readable PDF in the folder."""
     docs = []
     if not os.path.exists(doc_folder):
         print(f"Folder not found: {doc_folder}")
         return docs
 
-    for filename in os.listdir(doc_folder):
+    for filename in sorted(os.listdir(doc_folder)):
         file_path = os.path.join(doc_folder, filename)
         if os.path.isfile(file_path) and filename.endswith(".pdf"):
             try:
-                doc = fitz.open(file_path)
-                content = ""
-                for page in doc:
-                    content += page.get_text()
-                docs.append((filename, content))
+                docs.append((filename, pdf_cache.get_document(file_path)))
             except Exception as e:
                 print(f"Failed to read {filename}: {e}")
     return docs
 
-def split_into_chunks(text, max_chars=2000):
-    return [text[i:i + max_chars] for i in range(0, len(text), max_chars)]
+def split_into_chunks(pages):
+    return iter_chunks(pages, max_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+def load_chunks(documents):
+    """Chunk every document once per session; chunks are cached on disk by document content hash."""
+    all_chunks = []
+    for name, document in documents:
+        all_chunks.extend(CHUNK_STORE.get_chunks(
+            name, document.sha256, document.pages,
+            f"tokens:{CHUNK_TOKENS}:{CHUNK_OVERLAP_TOKENS}", split_into_chunks
+        ))
+    return all_chunks
 
 def build_prompt(chunk, user_question):
     messages = [
@@ -47,8 +70,8 @@ def build_prompt(chunk, user_question):
     ]
     return messages
 
-def query_openai(messages, retries=3, backoff=2):
-    payload = {
+def make_payload(messages):
+    return {
         "model": "gpt-3.5-turbo",
         "messages": messages,
         "max_tokens": 256,
@@ -56,19 +79,96 @@ def query_openai(messages, retries=3, backoff=2):
         "top_p": 1
     }
 
+def cached_answer(payload):
+    cached = completion_cache.default_cache().get(payload)
+    return None if cached is None else cached["choices"][0]["message"]["content"]
+
+def post_and_cache(payload):
+    """
+    Send the payload and cache a successful response. The cache write happens
+    in the same (worker) call as the request, so an answer that arrives after
+    its question stopped waiting for it is still kept for next time.
+    """
+    response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+    if response.status_code == 200:
+        completion_cache.default_cache().put(payload, response.json())
+    return response
+
+def parse_response(response, attempt):
+    """Return the answer from a successful response, or None after logging the error."""
+    if response.status_code != 200:
+        print(f"[Attempt {attempt+1}] Error {response.status_code}: {response.text}")
+        return None
+    return response.json()["choices"][0]["message"]["content"]
+
+def query_openai(messages, retries=3, backoff=2):
+    payload = make_payload(messages)
+    answer = cached_answer(payload)
+    if answer is not None:
+        return answer
+
     for attempt in range(retries):
         try:
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
-            if response.status_code == 200:
-                json_response = response.json()
-                return json_response["choices"][0]["message"]["content"]
-            else:
-                print(f"[Attempt {attempt+1}] Error {response.status_code}: {response.text}")
-                time.sleep(backoff ** attempt)
+            response = post_and_cache(payload)
+            answer = parse_response(response, attempt)
+            if answer is not None:
+                return answer
         except Exception as e:
             print(f"[Attempt {attempt+1}] Exception: {e}")
-            time.sleep(backoff ** attempt)
-    return "Failed to get a response from the model."
+        time.sleep(backoff ** attempt)
+    return FAILED_ANSWER
+
+async def query_openai_async(messages, retries=3, backoff=2):
+    payload = make_payload(messages)
+    answer = cached_answer(payload)
+    if answer is not None:
+        return answer
+
+    for attempt in range(retries):
+        try:
+            response = await api_client.arun(post_and_cache, payload)
+            answer = parse_response(response, attempt)
+            if answer is not None:
+                return answer
+        except Exception as e:
+            print(f"[Attempt {attempt+1}] Exception: {e}")
+        await asyncio.sleep(backoff ** attempt)
+    return FAILED_ANSWER
+
+async def answer_from_chunks(chunks, user_question, max_concurrency=MAX_CONCURRENT_REQUESTS, answers_needed=ANSWERS_NEEDED):
+    """Ask every chunk at once (at most `max_concurrency` in flight) and return answers as they arrive."""
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def ask(chunk):
+        memo_key = (chunk.id, user_question.strip().lower())
+        if memo_key in ANSWER_MEMO:
+            return ANSWER_MEMO[memo_key]
+        async with semaphore:
+            answer = await query_openai_async(build_prompt(f"# {chunk.doc} ({page_label(chunk)})\n{chunk.text}", user_question))
+        if answer != FAILED_ANSWER:
+            ANSWER_MEMO[memo_key] = answer
+        return answer
+
+    tasks = [asyncio.ensure_future(ask(chunk)) for chunk in chunks]
+    answers = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            answer = await next_done
+            if answer and NO_INFO_ANSWER not in answer and answer != FAILED_ANSWER:
+                answers.append(answer)
+                if len(answers) >= answers_needed:
+                    break
+    finally:
+        # Enough answers (or an error): drop the chunk prompts that are still queued. Requests already
+        # running in api_client's threads finish on their own and land in the completion cache
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    return answers
+
+def open_answer_cache(doc_folder="docs"):
+    """Semantic cache of HashBot replies, invalidated whenever the documents folder changes."""
+    return SemanticCache(make_api_embedder(API_URL_EMBED, HEADERS), folder_version(doc_folder))
 
 def main():
     print("Loading documents...")
@@ -76,6 +176,8 @@ def main():
     if not documents:
         print("No documents found. Please add PDF files in the 'docs/' folder.")
         return
+    all_chunks = load_chunks(documents)
+    answer_cache = open_answer_cache()
 
     print("Documents loaded. Ask your questions!")
     print("Type 'exit' to quit.\n")
@@ -85,21 +187,17 @@ def main():
         if question.strip().lower() == "exit":
             break
 
-        all_chunks = []
-        for name, content in documents:
-            chunks = split_into_chunks(f"# {name}\n{content}")
-            all_chunks.extend(chunks)
-
-        final_answers = []
+        cached = answer_cache.lookup(question)
+        if cached is not None:
+            print("HashBot:\n" + cached[0])
+            continue
 
-        for chunk in all_chunks:
-            messages = build_prompt(chunk, question)
-            answer = query_openai(messages)
-            if answer and "I don't have this information" not in answer:
-                final_answers.append(answer)
+        final_answers = asyncio.run(answer_from_chunks(all_chunks, question))
 
         if final_answers:
-            print("HashBot:\n" + "\n---\n".join(final_answers[:3]))  # Show top 3 chunks’ answers
+            reply = "\n---\n".join(final_answers)  # Show the first 3 chunks’ answers
+            answer_cache.store(question, reply)
+            print("HashBot:\n" + reply)
         else:
             print("HashBot: I don't have this information.\n")
 
@@ -54,48 +54,57 @@
 # print(response)
 
 
-import fitz
-import textwrap
-import requests
+import os
+import sys
+import argparse
+import pdf_cache
+from doc_chunks import iter_chunks
+from sparse_index import TfidfIndex
+import api_client
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
 
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
 API_TOKEN = "your-api-token-here"
 HEADERS = {'x-api-token': API_TOKEN, 'Content-Type': 'application/json'}
-
-# Step 1: Extract text from the PDF
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
-
-# Step 2: Chunk the text
-def chunk_text(text, chunk_size=2000):
-    return textwrap.wrap(text, chunk_size)
-
-# Load PDF and vectorize
-text = extract_text_from_pdf("your_pdf_file.pdf")
-chunks = chunk_text(text)
-vectorizer = TfidfVectorizer()
-vectors = vectorizer.fit_transform(chunks)
-
-# Step 3: Find most relevant chunk with similarity check
-def get_relevant_chunk(query, threshold=0.1):
-    query_vector = vectorizer.transform([query])
-    similarity_scores = (vectors * query_vector.T).toarray().flatten()
-    best_score = np.max(similarity_scores)
-    if best_score < threshold:
-        return None
-    best_index = np.argmax(similarity_scores)
-    return chunks[best_index]
+PDF_PATH = "your_pdf_file.pdf"
+INDEX_DIR = "tfidf_index"
+
+# Step 1: Extract page texts from the PDF (cached on disk, re-parsed only when the file changes)
+def extract_pages_from_pdf(pdf_path):
+    return pdf_cache.get_document(pdf_path).pages
+
+# Step 2: Chunk the pages (token-sized, sentence-aligned, overlapping)
+def chunk_text(pages, max_tokens=500, overlap_tokens=50):
+    return [chunk.text for chunk in iter_chunks(pages, max_tokens, overlap_tokens)]
+
+# Offline step: extract, chunk and fit TF-IDF once, then save the index for the query path
+def build_index(pdf_path=PDF_PATH, index_dir=INDEX_DIR):
+    stat = os.stat(pdf_path)
+    chunks = chunk_text(extract_pages_from_pdf(pdf_path))
+    index = TfidfIndex.build(chunks, source=os.path.abspath(pdf_path), size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+    index.save(index_dir)
+    print(f"Indexed {len(index)} chunks ({len(index.vocabulary)} terms) from {pdf_path} into {index_dir}/")
+
+def load_index(index_dir=INDEX_DIR):
+    if not TfidfIndex.exists(index_dir):
+        sys.exit(f"No index in {index_dir}/. Build it first: python assign18.2.py build {PDF_PATH}")
+    index = TfidfIndex.load(index_dir)
+    source = index.manifest.get("source")
+    if source and os.path.exists(source):
+        stat = os.stat(source)
+        if (stat.st_size, stat.st_mtime_ns) != (index.manifest.get("size"), index.manifest.get("mtime_ns")):
+            print(f"Warning: {source} changed since the index was built; re-run the build command.")
+    return index
+
+# Step 3: Find the most relevant chunks with similarity check
+def get_relevant_chunk(index, query, top_k=3, threshold=0.1):
+    """Return [(score, chunk)] for up to top_k chunks scoring at least threshold, best first."""
+    return [(score, index.chunk(chunk_id)) for chunk_id, score in index.search(query, top_k, threshold)]
 
 # Step 4: Build prompt
-def build_prompt(relevant_chunk, user_question):
-    return f"Context:\n{relevant_chunk}\n\nQuestion: {user_question}\nAnswer:"
+def build_prompt(relevant_chunks, user_question):
+    context = "\n\n---\n\n".join(chunk for _, chunk in relevant_chunks)
+    return f"Context:\n{context}\n\nQuestion: {user_question}\nAnswer:"
 
 # Step 5: Query OpenAI
 def query_openai(messages):
@@ -108,17 +117,33 @@ def query_openai(messages):
         "max_tokens": 500,
         "temperature": 0.5
     }
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+    response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
     return response.json()["choices"][0]["message"]["content"]
 
 # Step 6: Get dynamic input and respond
-user_question = input("Ask your question: ")
-relevant_chunk = get_relevant_chunk(user_question)
-
-if relevant_chunk:
-    prompt = build_prompt(relevant_chunk, user_question)
-    answer = query_openai(prompt)
-else:
-    answer = "I don't have this information."
-
-print("\nAnswer:", answer)
+def ask(index_dir=INDEX_DIR):
+    index = load_index(index_dir)
+    user_question = input("Ask your question: ")
+    relevant_chunks = get_relevant_chunk(index, user_question)
+
+    if relevant_chunks:
+        prompt = build_prompt(relevant_chunks, user_question)
+        answer = query_openai(prompt)
+    else:
+        answer = "I don't have this information."
+
+    print("\nAnswer:", answer)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Answer questions about a PDF from a prebuilt TF-IDF index.")
+    parser.add_argument("--index-dir", default=INDEX_DIR)
+    subcommands = parser.add_subparsers(dest="command")
+    build_parser = subcommands.add_parser("build", help="extract, chunk and index the PDF (run once per PDF change)")
+    build_parser.add_argument("pdf", nargs="?", default=PDF_PATH)
+    subcommands.add_parser("ask", help="answer a question from the saved index (default)")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_index(args.pdf, args.index_dir)
+    else:
+        ask(args.index_dir)
@@ -1,43 +1,86 @@
 import os
-import requests
+import api_client
 import json
 import time
-import fitz  
+import pdf_cache
+import completion_cache
+from semantic_cache import SemanticCache, folder_version, make_api_embedder
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from doc_chunks import count_tokens, iter_chunks, page_label
 
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
+API_URL_EMBED = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/embeddings/"
 API_TOKEN = "your-api-token-here"  # Replace this with your actual token
 
 HEADERS = {
     'x-api-token': API_TOKEN,
     'Content-Type': 'application/json'
 }
-    
-def extract_text_from_pdf(file_path):
-    try:
-        doc = fitz.open(file_path)
-        text = ""
-        for page in doc:
-            text += page.get_text()
-        doc.close()
-        return text.strip()
-    except Exception as e:
-        print(f"Failed to read {file_path}: {e}")
-        return ""
-    
-def load_documents(doc_folder="docs"):
-    docs = []
+
+CHUNK_TOKENS = 400            # Target chunk size (cl100k_base tokens) when indexing documents
+CHUNK_OVERLAP_TOKENS = 40     # Tokens repeated from the end of the previous chunk
+TOP_K_CHUNKS = 8              # Candidates retrieved per question
+CONTEXT_TOKEN_BUDGET = 2000   # Max document tokens sent per question
+NO_INFO_ANSWER = "I don't have this information."
+FAILED_ANSWER = "Failed to get a response from the model."
+
+def iter_documents(doc_folder="docs", max_workers=None):
+    """Yield (filename, pages) as each PDF finishes extracting, using all cores for uncached files."""
     if not os.path.exists(doc_folder):
         print(f"Folder not found: {doc_folder}")
-        return docs
+        return
+
+    paths = [os.path.join(doc_folder, filename) for filename in sorted(os.listdir(doc_folder))
+             if filename.endswith(".pdf") and os.path.isfile(os.path.join(doc_folder, filename))]
+    start = time.perf_counter()
+    loaded = failed = 0
+    for result in pdf_cache.ingest_pdfs(paths, max_workers=max_workers):
+        filename = os.path.basename(result.path)
+        if result.error:
+            failed += 1
+            print(f"Failed to read {filename} after {result.seconds:.2f}s: {result.error}")
+            continue
+        source = "cache" if result.cached else f"{len(result.document.pages)} pages"
+        print(f"Loaded {filename} ({source}, {result.seconds:.2f}s)")
+        if any(page.strip() for page in result.document.pages):
+            loaded += 1
+            yield filename, result.document.pages
+    print(f"Ingested {loaded} documents ({failed} failed) in {time.perf_counter() - start:.2f}s")
+
+def load_documents(doc_folder="docs"):
+    return list(iter_documents(doc_folder))
 
-    for filename in os.listdir(doc_folder):
-        file_path = os.path.join(doc_folder, filename)
-        if os.path.isfile(file_path) and filename.endswith(".pdf"):
-            content = extract_text_from_pdf(file_path)
-            if content:
-                docs.append((filename, content))
-    return docs
 
+class ChunkIndex:
+    """TF-IDF index over (source label, chunk) pairs, built once per session."""
+    def __init__(self, documents):
+        self.chunks = []
+        for name, pages in documents:
+            self.chunks.extend((f"{name} ({page_label(chunk)})", chunk.text)
+                               for chunk in iter_chunks(pages, CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS))
+        self.vectorizer = TfidfVectorizer()
+        self.matrix = self.vectorizer.fit_transform([chunk for _, chunk in self.chunks]) if self.chunks else None
+
+    def search(self, question, top_k=TOP_K_CHUNKS):
+        """Return [(score, (name, chunk))] for the best matching chunks, best first."""
+        if self.matrix is None:
+            return []
+        scores = (self.matrix @ self.vectorizer.transform([question]).T).tocoo()
+        order = np.argsort(-scores.data)[:top_k]
+        return [(float(scores.data[i]), self.chunks[scores.row[i]]) for i in order]
+
+def select_context(ranked_chunks, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Take chunks in rank order while they fit in the token budget."""
+    selected = []
+    used = 0
+    for _, (name, chunk) in ranked_chunks:
+        cost = count_tokens(f"# {name}\n{chunk}")
+        if used + cost > token_budget:
+            continue  # A smaller, lower-ranked chunk may still fit
+        selected.append((name, chunk))
+        used += cost
+    return selected
 
 def build_prompt(docs, user_question):
     context = "\n\n---\n\n".join([f"# {name}\n{content}" for name, content in docs])
@@ -61,28 +104,40 @@ def query_openai(messages, retries=3, backoff=2):
         "temperature": 0,
         "top_p": 1
     }
+    cache = completion_cache.default_cache()
+    cached = cache.get(payload)
+    if cached is not None:
+        return cached["choices"][0]["message"]["content"]
 
     for attempt in range(retries):
         try:
-            response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+            response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
             if response.status_code == 200:
-                return response.json()["choices"][0]["message"]["content"]
+                json_response = response.json()
+                cache.put(payload, json_response)
+                return json_response["choices"][0]["message"]["content"]
             else:
                 print(f"[Attempt {attempt+1}] Error {response.status_code}: {response.text}")
                 time.sleep(backoff ** attempt)
         except Exception as e:
             print(f"[Attempt {attempt+1}] Exception: {e}")
             time.sleep(backoff ** attempt)
-    return "Failed to get a response from the model."
+    return FAILED_ANSWER
+
+def open_answer_cache(doc_folder="docs"):
+    """Semantic cache of HashBot replies, invalidated whenever the documents folder changes."""
+    return SemanticCache(make_api_embedder(API_URL_EMBED, HEADERS), folder_version(doc_folder))
 
 def main():
     print("Loading documents...")
-    documents = load_documents()
-    if not documents:
+    index = ChunkIndex(iter_documents())
+    if not index.chunks:
         print("No documents found. Please add PDF files in the 'docs/' folder.")
         return
 
-    print("Documents loaded. Ask your questions!")
+    answer_cache = open_answer_cache()
+
+    print(f"Indexed {len(index.chunks)} chunks. Ask your questions!")
     print("Type 'exit' to quit.\n")
 
     while True:
@@ -90,8 +145,20 @@ def main():
         if question.strip().lower() == "exit":
             break
 
-        messages = build_prompt(documents, question)
+        cached = answer_cache.lookup(question)
+        if cached is not None:
+            print(f"HashBot: {cached[0]}\n")
+            continue
+
+        context = select_context(index.search(question))
+        if not context:
+            print(f"HashBot: {NO_INFO_ANSWER}\n")
+            continue
+
+        messages = build_prompt(context, question)
         response = query_openai(messages)
+        if response != FAILED_ANSWER:
+            answer_cache.store(question, response)
         print(f"HashBot: {response}\n")
 
 if __name__ == "__main__":
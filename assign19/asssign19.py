@@ -1,9 +1,12 @@
-import fitz  # PyMuPDF
-import textwrap
-import requests
+import os
+import sys
 import json
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_client  # shared pooled HTTP client at the repo root
+import pdf_cache  # cached PyMuPDF text extraction at the repo root
+from doc_chunks import iter_chunks  # token-aware chunker at the repo root
+from sparse_index import SparseChunkIndex  # shared multi-document TF-IDF index at the repo root
 
 # === CONFIG ===
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
@@ -12,40 +15,34 @@ HEADERS = {
     'x-api-token': API_TOKEN,
     'Content-Type': 'application/json'
 }
+# (label used in the prompt, PDF path); add a line here to compare another document
+DOCUMENTS = [
+    ("Document 1 (Adult General Checkup)", "Document1.pdf"),
+    ("Document 2 (Child General Checkup)", "Document2.pdf"),
+]
+
+# === STEP 1: Extract page texts from PDF (cached on disk, re-parsed only when the file changes) ===
+def extract_pages_from_pdf(pdf_path):
+    return pdf_cache.get_document(pdf_path).pages
 
-# === STEP 1: Extract text from PDF ===
-def extract_text_from_pdf(pdf_path):
-    doc = fitz.open(pdf_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
-
-# === STEP 2: Chunk the text ===
-def chunk_text(text, chunk_size=2000):
-    return textwrap.wrap(text, chunk_size)
-
-# === STEP 3: Find most relevant chunk using TF-IDF ===
-def get_relevant_chunk(query, vectorizer, vectors, chunks, threshold=0.1):
-    query_vector = vectorizer.transform([query])
-    similarity_scores = (vectors * query_vector.T).toarray().flatten()
-    best_score = np.max(similarity_scores)
-    
-    if best_score < threshold:
-        return None  # Return None if no relevant chunk is found
-    
-    best_index = np.argmax(similarity_scores)
-    return chunks[best_index]
+# === STEP 2: Chunk the pages (token-sized, sentence-aligned, overlapping) ===
+def chunk_text(pages, max_tokens=500, overlap_tokens=50):
+    return [chunk.text for chunk in iter_chunks(pages, max_tokens, overlap_tokens)]
+
+# === STEP 3: Find the most relevant chunks of every document in one scoring pass ===
+def get_relevant_chunk(query, index, top_k=2, threshold=0.1):
+    """Return {document label: [(score, chunk)] best first, empty if nothing in that document is relevant}."""
+    return index.search_per_document(query, top_k=top_k, threshold=threshold)
 
 # === STEP 4: Build the prompt for OpenAI ===
-def build_prompt(relevant_chunk1, relevant_chunk2, question):
+def build_prompt(relevant_chunks, question):
+    context = "\n\n".join(
+        f"Context from {label}:\n" + "\n...\n".join(chunk for _, chunk in ranked)
+        for label, ranked in relevant_chunks.items()
+    )
     return f"""You are a helpful assistant.
 
-Context from Document 1 (Adult General Checkup):
-{relevant_chunk1}
-
-Context from Document 2 (Child General Checkup):
-{relevant_chunk2}
+{context}
 
 Question: {question}
 
@@ -62,31 +59,15 @@ def query_openai(prompt):
         "max_tokens": 500,
         "temperature": 0.5
     }
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+    response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
     return response.json()["choices"][0]["message"]["content"]
 
 # === MAIN FLOW ===
 if __name__ == "__main__":
-    # Load and chunk Document 1 (Adult General Checkup)
-    text1 = extract_text_from_pdf("Document1.pdf")
-    chunks1 = chunk_text(text1)
-    
-    # Vectorize Document 1
-    vectorizer1 = TfidfVectorizer()
-    vectors1 = vectorizer1.fit_transform(chunks1)
-
-    # Load and chunk Document 2 (Child General Checkup)
-    text2 = extract_text_from_pdf("Document2.pdf")
-    chunks2 = chunk_text(text2)
-    
-    # Vectorize Document 2
-    vectorizer2 = TfidfVectorizer()
-    vectors2 = vectorizer2.fit_transform(chunks2)
-
-    # # Combine all chunks for vectorization
-    # all_chunks = chunks1 + chunks2
-    # vectorizer = TfidfVectorizer()
-    # vectors = vectorizer.fit_transform(all_chunks)
+    # Load, chunk and index every document into one shared index
+    index = SparseChunkIndex()
+    for label, pdf_path in DOCUMENTS:
+        index.add_document(label, chunk_text(extract_pages_from_pdf(pdf_path)))
 
     # Ask the user for questions dynamically
     print("Please enter your questions below. Type 'exit' to stop.")
@@ -97,18 +78,16 @@ if __name__ == "__main__":
             print("Exiting program...")
             break
         
-        # Find relevant chunks for the question in both documents
-        relevant_chunk1 = get_relevant_chunk(question, vectorizer1, vectors1, chunks1)
-        relevant_chunk2 = get_relevant_chunk(question, vectorizer2, vectors2, chunks2)
+        # Find relevant chunks for the question in every document
+        relevant_chunks = get_relevant_chunk(question, index)
 
         # If no relevant chunk is found for a document, handle gracefully
-        if not relevant_chunk1:
-            relevant_chunk1 = "No relevant information found in Document 1."
-        if not relevant_chunk2:
-            relevant_chunk2 = "No relevant information found in Document 2."
+        for doc_no, (label, ranked) in enumerate(relevant_chunks.items(), start=1):
+            if not ranked:
+                relevant_chunks[label] = [(0.0, f"No relevant information found in Document {doc_no}.")]
 
         # Build the prompt and get the answer
-        prompt = build_prompt(relevant_chunk1, relevant_chunk2, question)
+        prompt = build_prompt(relevant_chunks, question)
         answer = query_openai(prompt)
 
         # Output the answer
@@ -1,8 +1,11 @@
 import pandas as pd
 import os
-import requests
+import sys
 import json
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_client  # shared pooled HTTP client at the repo root
+
 
 INPUT_FILE = "students_marks.xlsx"
 API_URL = "https://openai-api-wrapper-urtjok3rza-wl.a.run.app/api/chat/completions/"
@@ -51,7 +54,7 @@ The report should highlight how students were assigned to departments based on e
         "temperature": 0.5
     }
 
-    response = requests.post(API_URL, headers=HEADERS, data=json.dumps(payload))
+    response = api_client.post(API_URL, headers=HEADERS, data=json.dumps(payload))
     return response.json()["choices"][0]["message"]["content"]
 
 # === Save Report ===
@@ -1,13 +1,17 @@
+import io
 import os
 import time
 import json
-import requests
+import hashlib
+import api_client
 import numpy as np
 import tiktoken
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterable
 from pathlib import Path
 import logging
 
+from vector_index import make_index
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -29,13 +33,25 @@ tokenizer = tiktoken.get_encoding("cl100k_base")  # Default for GPT models
 
 class CodeSnippet:
     """Class to represent a code snippet with its embedding."""
-    def __init__(self, content: str, description: str, tags: List[str], path: Optional[str] = None):
-        self.content = content
+    def __init__(self, content: Optional[str], description: str, tags: List[str], path: Optional[str] = None):
+        self._content = content
+        self._content_loader: Optional[Callable[[], str]] = None
         self.description = description
         self.tags = tags
         self.path = path
         self.embedding = None
     
+    @property
+    def content(self) -> str:
+        """Snippet body, read from the store on first access when loaded lazily."""
+        if self._content is None and self._content_loader is not None:
+            self._content = self._content_loader()
+        return self._content
+    
+    @content.setter
+    def content(self, value: str) -> None:
+        self._content = value
+    
     def to_dict(self) -> Dict[str, Any]:
         """Convert the snippet to a dictionary."""
         return {
@@ -58,11 +74,51 @@ class CodeSnippet:
         return f"CodeSnippet(description={self.description}, tags={self.tags}, len={len(self.content)})"
 
 class VectorStore:
-    """Simple vector store for code snippets."""
-    def __init__(self, snippets_dir: str = "snippets"):
+    """
+    Vector store for code snippets, persisted in an append-only columnar layout:
+
+    - embeddings.f32: contiguous float32 matrix (one row per snippet), memory-mapped on load
+    - snippets_meta.jsonl: one line of description/tags/path plus the body's byte range
+    - snippets_content.bin: UTF-8 snippet bodies, read only when a snippet's content is used
+    - norms.f32: L2 norm of every embedding row, so the index never copies or normalizes the matrix
+    - ivf_centroids.npy / ivf_labels.i32: trained IVF centroids and each row's bucket (index_type="ivf" only)
+    - manifest.json: format version, dimension, committed count, file sizes and index settings
+
+    New snippets are buffered and appended to the data files on flush();
+    rewriting manifest.json is the commit point. compact() rewrites the files
+    without duplicate snippets. Loading maps the files and restores the index
+    from them, so startup does not grow with the size of the matrix.
+    """
+    FORMAT_VERSION = 1
+    BULK_FLUSH_SIZE = 1000  # Snippets per commit during add_snippets()
+    COMPACT_MIN_DUPLICATES = 100  # Auto-compact only once this many duplicates have piled up...
+    COMPACT_RATIO = 0.25  # ...and they are this share of the store
+    
+    def __init__(self, snippets_dir: str = "snippets", flush_every: int = 1,
+                 index_type: str = "flat", **index_params):
         self.snippets_dir = Path(snippets_dir)
+        self.flush_every = flush_every
+        self.index_type = index_type
+        self.index_params = index_params
+        self.index = make_index(index_type, EMBEDDING_DIMENSION, **index_params)
         self.snippets: List[CodeSnippet] = []
-        self.snippets_file = self.snippets_dir / "snippets.json"
+        self.embeddings = np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+        self.embeddings_file = self.snippets_dir / "embeddings.f32"
+        self.meta_file = self.snippets_dir / "snippets_meta.jsonl"
+        self.content_file = self.snippets_dir / "snippets_content.bin"
+        self.manifest_file = self.snippets_dir / "manifest.json"
+        self.norms_file = self.snippets_dir / "norms.f32"
+        self.ivf_centroids_file = self.snippets_dir / "ivf_centroids.npy"
+        self.ivf_labels_file = self.snippets_dir / "ivf_labels.i32"
+        self.norms = np.empty(0, dtype=np.float32)
+        self._saved_centroids = None  # Centroids last written to ivf_centroids_file
+        self.legacy_snippets_file = self.snippets_dir / "snippets.json"
+        self._manifest = {"version": self.FORMAT_VERSION, "dim": EMBEDDING_DIMENSION,
+                          "count": 0, "content_bytes": 0, "meta_bytes": 0}
+        self._pending: List[CodeSnippet] = []
+        self._digests: List[str] = []
+        self._digest_set = set()
+        self._duplicates = 0
         
         # Create directory if it doesn't exist
         os.makedirs(self.snippets_dir, exist_ok=True)
@@ -71,50 +127,303 @@ class VectorStore:
         self.load_snippets()
     
     def add_snippet(self, snippet: CodeSnippet) -> None:
-        """Add a snippet to the vector store."""
+        """Add a snippet; it is written to disk on the next flush() (every `flush_every` inserts)."""
         if snippet.embedding is None:
             raise ValueError("Snippet must have an embedding")
+        self._track_digest(self._digest(snippet))
         self.snippets.append(snippet)
+        self.index.add(snippet.embedding)
+        self._pending.append(snippet)
+        if len(self._pending) >= self.flush_every:
+            self.flush()
+    
+    def add_snippets(self, snippets: Iterable[CodeSnippet]) -> int:
+        """Bulk insert, committed in batches of BULK_FLUSH_SIZE. Returns the number added."""
+        added = 0
+        for snippet in snippets:
+            if snippet.embedding is None:
+                raise ValueError("Snippet must have an embedding")
+            self._track_digest(self._digest(snippet))
+            self.snippets.append(snippet)
+            self._pending.append(snippet)
+            added += 1
+            if len(self._pending) >= self.BULK_FLUSH_SIZE:
+                self._index_pending()
+                self.flush()
+        self._index_pending()
+        self.flush()
+        return added
+    
+    def _index_pending(self) -> None:
+        """Insert the buffered, not yet indexed snippets into the search index in one batch."""
+        new_rows = len(self.snippets) - len(self.index)
+        if new_rows > 0:
+            self.index.add(np.array([s.embedding for s in self.snippets[-new_rows:]], dtype=np.float32))
+    
+    def rebuild_index(self, restore: bool = False) -> None:
+        """
+        Rebuild the search index over every stored embedding. Flat and IVF
+        indexes search the memory-mapped matrix in place; with `restore`, an
+        IVF index reuses the centroids and buckets saved by an earlier run
+        instead of retraining.
+        """
+        dim = self.embeddings.shape[1]
+        if self.index_type == "hnsw":
+            self.index = make_index(self.index_type, dim, **self.index_params)
+            self.index.add(self.embeddings)
+        else:
+            params = dict(self.index_params, base=self.embeddings, base_norms=self.norms)
+            if self.index_type == "ivf" and restore:
+                params.update(self._saved_ivf_state())
+            self.index = make_index(self.index_type, dim, **params)
+        self._index_pending()
+        if self.index_type == "ivf":
+            if self.index.is_trained:
+                # Only does work if the index was (re)trained rather than restored
+                self._save_ivf_state(len(self.embeddings), len(self.embeddings))
+                if self._manifest.get("index") != self._index_settings():
+                    self._write_manifest(dict(self._manifest, index=self._index_settings()))
+            else:
+                # Buckets from a bigger, older version of the store must not be restored later
+                for path in (self.ivf_centroids_file, self.ivf_labels_file):
+                    if path.exists():
+                        path.unlink()
+    
+    def _index_settings(self) -> Dict[str, Any]:
+        return {"type": self.index_type, "params": self.index_params}
+    
+    def _saved_ivf_state(self) -> Dict[str, Any]:
+        """Centroids and labels from disk, if they were saved for this data and these index settings."""
+        count = len(self.embeddings)
+        if (self._manifest.get("index") != self._index_settings() or not self.ivf_centroids_file.exists()
+                or not self.ivf_labels_file.exists() or os.path.getsize(self.ivf_labels_file) < count * 4):
+            return {}
+        centroids = np.load(self.ivf_centroids_file)
+        self._saved_centroids = centroids
+        labels = np.memmap(self.ivf_labels_file, dtype=np.int32, mode="r", shape=(count,)) if count else np.empty(0, np.int32)
+        return {"centroids": centroids, "labels": labels}
+    
+    def _save_ivf_state(self, start: int, stop: int) -> None:
+        """Write the IVF buckets of rows [start, stop); everything if the index was retrained since the last save."""
+        if not getattr(self.index, "is_trained", False) or len(self.index.labels) < stop:
+            return
+        if self.index.centroids is not self._saved_centroids:
+            start = 0
+            centroids = io.BytesIO()
+            np.save(centroids, self.index.centroids)
+            self._replace_file(self.ivf_centroids_file, centroids.getvalue())
+            self._saved_centroids = self.index.centroids
+        self._truncate(self.ivf_labels_file, start * 4)
+        with open(self.ivf_labels_file, "ab") as f:
+            f.write(self.index.labels[start:stop].astype(np.int32).tobytes())
+    
+    def flush(self) -> None:
+        """Append buffered snippets to the data files and commit them in the manifest."""
+        if not self._pending:
+            return
+        manifest = dict(self._manifest)
+        dim = manifest["dim"] if manifest["count"] else int(np.asarray(self._pending[0].embedding).shape[0])
+        matrix = np.array([snippet.embedding for snippet in self._pending], dtype=np.float32)
+        if matrix.shape[1] != dim:
+            raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match store dimension {dim}")
+        
+        # Drop anything a crashed flush wrote past the last commit before appending
+        self._truncate(self.embeddings_file, manifest["count"] * dim * 4)
+        self._truncate(self.content_file, manifest["content_bytes"])
+        self._truncate(self.meta_file, manifest["meta_bytes"])
+        
+        meta_lines = []
+        bodies = []
+        offset = manifest["content_bytes"]
+        for snippet, digest in zip(self._pending, self._digests[-len(self._pending):]):
+            body = snippet.content.encode("utf-8")
+            bodies.append(body)
+            meta_lines.append(self._meta_line(snippet, digest, offset, len(body)))
+            offset += len(body)
+        meta_bytes = "".join(meta_lines).encode("utf-8")
+        
+        self._truncate(self.norms_file, manifest["count"] * 4)
+        with open(self.norms_file, "ab") as f:
+            f.write(np.linalg.norm(matrix, axis=1).astype(np.float32).tobytes())
+        with open(self.embeddings_file, "ab") as f:
+            f.write(matrix.tobytes())
+        with open(self.content_file, "ab") as f:
+            f.write(b"".join(bodies))
+        with open(self.meta_file, "ab") as f:
+            f.write(meta_bytes)
+        
+        old_count = manifest["count"]
+        manifest.update(dim=dim, count=old_count + len(self._pending), content_bytes=offset,
+                        meta_bytes=manifest["meta_bytes"] + len(meta_bytes), index=self._index_settings())
+        if self.index_type == "ivf":
+            self._save_ivf_state(old_count, manifest["count"])
+        self._write_manifest(manifest)
+        self._pending = []
+        self.embeddings = np.memmap(self.embeddings_file, dtype=np.float32, mode="r", shape=(manifest["count"], dim))
+        self.norms = np.memmap(self.norms_file, dtype=np.float32, mode="r", shape=(manifest["count"],))
+        
+        if self._duplicates >= self.COMPACT_MIN_DUPLICATES and self._duplicates >= self.COMPACT_RATIO * len(self.snippets):
+            self.compact()
+    
+    def compact(self) -> None:
+        """Rewrite the store keeping only the latest copy of each duplicated snippet."""
+        self.flush()
+        latest = {digest: i for i, digest in enumerate(self._digests)}
+        keep = sorted(latest.values())
+        removed = len(self.snippets) - len(keep)
+        self.snippets = [self.snippets[i] for i in keep]
+        self._digests = [self._digests[i] for i in keep]
+        self._digest_set = set(self._digests)
+        self._duplicates = 0
         self.save_snippets()
+        logger.info(f"Compacted vector store: removed {removed} duplicate snippets")
     
     def save_snippets(self) -> None:
-        """Save snippets to disk."""
-        with open(self.snippets_file, "w") as f:
-            json.dump([snippet.to_dict() for snippet in self.snippets], f)
+        """Rewrite the whole store to disk."""
+        # Materialize everything first so no memory map still points at the files being replaced
+        matrix = np.array([snippet.embedding for snippet in self.snippets], dtype=np.float32)
+        matrix = matrix.reshape(len(self.snippets), -1) if self.snippets else self.embeddings[:0].copy()
+        contents = [snippet.content.encode("utf-8") for snippet in self.snippets]
+        for snippet, row in zip(self.snippets, matrix):
+            snippet.embedding = row
+        self.embeddings = matrix
+        self.norms = np.linalg.norm(matrix, axis=1).astype(np.float32)
+        self._pending = []
+        self._replace_file(self.norms_file, self.norms.tobytes())
+        self.rebuild_index()
+        
+        offset = 0
+        meta_lines = []
+        for snippet, digest, body in zip(self.snippets, self._digests, contents):
+            meta_lines.append(self._meta_line(snippet, digest, offset, len(body)))
+            offset += len(body)
+        meta_bytes = "".join(meta_lines).encode("utf-8")
+        
+        self._replace_file(self.embeddings_file, matrix.tobytes())
+        self._replace_file(self.content_file, b"".join(contents))
+        self._replace_file(self.meta_file, meta_bytes)
+        # The manifest is written last: it is what marks the new files as committed
+        self._write_manifest({"version": self.FORMAT_VERSION, "dim": int(matrix.shape[1]), "count": len(self.snippets),
+                              "content_bytes": offset, "meta_bytes": len(meta_bytes), "index": self._index_settings()})
     
     def load_snippets(self) -> None:
-        """Load snippets from disk."""
-        if not self.snippets_file.exists():
-            logger.info(f"No snippets file found at {self.snippets_file}")
+        """Load snippets from disk; embeddings are memory-mapped and bodies are read lazily."""
+        if not self.manifest_file.exists():
+            if self.legacy_snippets_file.exists():
+                self._migrate_legacy_snippets()
+            else:
+                logger.info(f"No snippets found in {self.snippets_dir}")
             return
         
         try:
-            with open(self.snippets_file, "r") as f:
-                snippets_data = json.load(f)
-                self.snippets = [CodeSnippet.from_dict(data) for data in snippets_data]
-            logger.info(f"Loaded {len(self.snippets)} snippets from {self.snippets_file}")
+            with open(self.manifest_file, "r") as f:
+                manifest = json.load(f)
+            count, dim = manifest["count"], manifest["dim"]
+            manifest.setdefault("content_bytes", os.path.getsize(self.content_file))
+            manifest.setdefault("meta_bytes", os.path.getsize(self.meta_file))
+            if count:
+                self.embeddings = np.memmap(self.embeddings_file, dtype=np.float32, mode="r", shape=(count, dim))
+            else:
+                self.embeddings = np.empty((0, dim), dtype=np.float32)
+            self.norms = self._load_norms(count)
+            
+            self.snippets = []
+            self._digests = []
+            self._digest_set = set()
+            self._duplicates = 0
+            with open(self.meta_file, "r", encoding="utf-8") as f:
+                for row, line in zip(range(count), f):
+                    meta = json.loads(line)
+                    snippet = CodeSnippet(None, meta["description"], meta["tags"], meta.get("path"))
+                    snippet._content_loader = self._content_reader(meta["offset"], meta["length"])
+                    snippet.embedding = self.embeddings[row]
+                    self.snippets.append(snippet)
+                    self._track_digest(meta.get("digest") or self._digest(snippet))
+            self._manifest = manifest
+            self.rebuild_index(restore=True)
+            logger.info(f"Loaded {len(self.snippets)} snippets from {self.snippets_dir}")
         except Exception as e:
             logger.error(f"Error loading snippets: {e}")
     
+    def _load_norms(self, count: int) -> np.ndarray:
+        """Memory-map the row norms, computing them once for stores written before norms.f32 existed."""
+        if self.norms_file.exists() and os.path.getsize(self.norms_file) >= count * 4:
+            return np.memmap(self.norms_file, dtype=np.float32, mode="r", shape=(count,)) if count else self.norms[:0]
+        norms = np.concatenate([np.linalg.norm(self.embeddings[start:start + self.BULK_FLUSH_SIZE], axis=1)
+                                for start in range(0, count, self.BULK_FLUSH_SIZE)] or [self.norms[:0]])
+        self._replace_file(self.norms_file, norms.astype(np.float32).tobytes())
+        return norms.astype(np.float32)
+    
+    def _content_reader(self, offset: int, length: int) -> Callable[[], str]:
+        """Return a callable that reads one snippet body from the content file."""
+        def read() -> str:
+            with open(self.content_file, "rb") as f:
+                f.seek(offset)
+                return f.read(length).decode("utf-8")
+        return read
+    
+    def _migrate_legacy_snippets(self) -> None:
+        """Convert a store saved as a single snippets.json into the columnar layout."""
+        try:
+            with open(self.legacy_snippets_file, "r") as f:
+                self.snippets = [CodeSnippet.from_dict(data) for data in json.load(f)]
+            for snippet in self.snippets:
+                self._track_digest(self._digest(snippet))
+            self.save_snippets()
+            logger.info(f"Migrated {len(self.snippets)} snippets from {self.legacy_snippets_file}")
+        except Exception as e:
+            logger.error(f"Error migrating snippets: {e}")
+    
+    @staticmethod
+    def _digest(snippet: CodeSnippet) -> str:
+        """Content hash used to spot duplicate snippets."""
+        key = json.dumps([snippet.description, snippet.tags, snippet.path, snippet.content])
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()
+    
+    def _track_digest(self, digest: str) -> None:
+        if digest in self._digest_set:
+            self._duplicates += 1
+        else:
+            self._digest_set.add(digest)
+        self._digests.append(digest)
+    
+    @staticmethod
+    def _meta_line(snippet: CodeSnippet, digest: str, offset: int, length: int) -> str:
+        return json.dumps({
+            "description": snippet.description,
+            "tags": snippet.tags,
+            "path": snippet.path,
+            "digest": digest,
+            "offset": offset,
+            "length": length
+        }) + "\n"
+    
+    def _write_manifest(self, manifest: Dict[str, Any]) -> None:
+        self._replace_file(self.manifest_file, json.dumps(manifest).encode("utf-8"))
+        self._manifest = manifest
+    
+    @staticmethod
+    def _truncate(path: Path, size: int) -> None:
+        if path.exists() and os.path.getsize(path) > size:
+            with open(path, "r+b") as f:
+                f.truncate(size)
+    
+    @staticmethod
+    def _replace_file(path: Path, data: bytes) -> None:
+        """Write data to a temporary file and atomically swap it into place."""
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    
     def search(self, query_embedding: np.ndarray, top_k: int = 3) -> List[CodeSnippet]:
-        """Search for similar snippets by cosine similarity."""
+        """Search for similar snippets by cosine similarity using the configured index."""
         if not self.snippets:
             logger.warning("No snippets in vector store")
             return []
         
-        similarities = []
-        for snippet in self.snippets:
-            if snippet.embedding is not None:
-                similarity = self._cosine_similarity(query_embedding, snippet.embedding)
-                similarities.append((similarity, snippet))
-        
-        # Sort by similarity (descending)
-        similarities.sort(reverse=True, key=lambda x: x[0])
-        return [snippet for _, snippet in similarities[:top_k]]
-    
-    def _cosine_similarity(self, a: np.ndarray, b: np.ndarray) -> float:
-        """Calculate cosine similarity between two vectors."""
-        return np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+        ids, _ = self.index.search(query_embedding, top_k)
+        return [self.snippets[i] for i in ids]
 
 class APIWrapper:
     """Wrapper for API calls with retry logic."""
@@ -148,7 +457,7 @@ class APIWrapper:
                 }
                 
                 logger.info(f"Calling wrapper API (attempt {attempt+1}/{MAX_RETRIES})...")
-                response = requests.post(
+                response = api_client.post(
                     self.api_url, 
                     headers=self.headers, 
                     json=payload
@@ -190,6 +499,7 @@ class CodeGenerator:
     
     def prepare_snippets_library(self, snippets_data: List[Dict[str, Any]]) -> None:
         """Prepare the snippets library by embedding and storing code examples."""
+        embedded = []
         for snippet_data in snippets_data:
             snippet = CodeSnippet(
                 content=snippet_data["content"],
@@ -203,10 +513,12 @@ class CodeGenerator:
             
             if embedding is not None:
                 snippet.embedding = embedding
-                self.vector_store.add_snippet(snippet)
+                embedded.append(snippet)
                 logger.info(f"Added snippet: {snippet.description}")
             else:
                 logger.error(f"Failed to get embedding for snippet: {snippet.description}")
+        
+        self.vector_store.add_snippets(embedded)
     
     def generate_code_from_requirement(self, requirement: str) -> str:
         """Generate code based on a requirement using RAG."""
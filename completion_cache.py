@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_DB_PATH = os.environ.get("COMPLETION_CACHE_DB", "completion_cache.sqlite3")
+DEFAULT_TTL = float(os.environ.get("COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))  # seconds
+DEFAULT_MAX_ENTRIES = int(os.environ.get("COMPLETION_CACHE_MAX_ENTRIES", "10000"))  # on disk
+DEFAULT_MEMORY_ENTRIES = 256
+
+
+def is_deterministic(payload: dict) -> bool:
+    """Only temperature-0, single-choice completions are safe to replay."""
+    return payload.get("temperature") == 0 and payload.get("n", 1) == 1
+
+
+class CompletionCache:
+    """
+    Content-addressed cache of chat-completion responses.
+
+    The key is a hash of the canonical JSON of the whole request payload
+    (model, messages and sampling parameters), so any change to the request
+    is a different entry. Lookups go to an in-memory LRU first and a SQLite
+    file second. Entries expire after `ttl` seconds; past `max_entries` the
+    least recently used rows are evicted from disk. Payloads that are not
+    deterministic (see is_deterministic) are never cached.
+    """
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl: float = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES, memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created, response)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS completions (
+                key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS completions_last_used ON completions (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(payload: dict) -> str:
+        canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, payload: dict) -> Optional[dict]:
+        """Return the cached response JSON, or None on a miss or a non-deterministic payload."""
+        if not is_deterministic(payload):
+            return None
+        key = self.make_key(payload)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+
+            row = self._conn.execute("SELECT response, created FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] >= self.ttl:
+                if row is not None:
+                    self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                    self._conn.commit()
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE completions SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            response = json.loads(row[0])
+            self._remember(key, row[1], response)
+            self.disk_hits += 1
+            return response
+
+    def put(self, payload: dict, response: dict) -> None:
+        """Store a successful response; non-deterministic payloads are ignored."""
+        if not is_deterministic(payload):
+            return
+        key = self.make_key(payload)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)", (key, json.dumps(response), now, now)
+            )
+            excess = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0] - self.max_entries
+            if excess > 0:
+                self._conn.execute(
+                    "DELETE FROM completions WHERE key IN "
+                    "(SELECT key FROM completions ORDER BY last_used LIMIT ?)", (excess,)
+                )
+            self._conn.commit()
+            self._remember(key, now, response)
+
+    def prune(self) -> None:
+        """Delete expired entries from both tiers."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            self._conn.execute("DELETE FROM completions WHERE created <= ?", (cutoff,))
+            self._conn.commit()
+            for key in [key for key, (created, _) in self._memory.items() if created <= cutoff]:
+                del self._memory[key]
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _remember(self, key: str, created: float, response: dict) -> None:
+        self._memory[key] = (created, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> CompletionCache:
+    """Process-wide cache at DEFAULT_DB_PATH, opened on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = CompletionCache()
+    return _default_cache
@@ -0,0 +1,200 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from typing import Callable, Iterable, Iterator, List
+
+import tiktoken
+
+DEFAULT_DB_PATH = os.environ.get("CHUNK_CACHE_DB", "chunk_cache.sqlite3")
+DEFAULT_MAX_TOKENS = 500
+DEFAULT_OVERLAP_TOKENS = 50
+
+# id: stable across questions and restarts (see make_chunk_id)
+# doc: document name, index: position of the chunk within its document
+# first_page / last_page: 1-based pages the chunk text came from
+Chunk = namedtuple("Chunk", ["id", "doc", "index", "text", "first_page", "last_page"])
+# One piece of iter_chunks() output, before it is given an id
+TextChunk = namedtuple("TextChunk", ["text", "first_page", "last_page", "tokens"])
+# Sentence-sized unit the chunker packs; starts_paragraph marks a preferred cut point
+_Unit = namedtuple("_Unit", ["text", "page", "tokens", "starts_paragraph"])
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+
+_encoding = None
+
+
+def make_chunk_id(doc: str, text: str) -> str:
+    """
+    Content-addressed chunk id: the same text from the same document always
+    gets the same id, even after unrelated parts of the document change.
+    """
+    return hashlib.sha1(f"{doc}\0{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    return len(_get_encoding().encode(text))
+
+
+def page_label(chunk) -> str:
+    """Human-readable page range of a Chunk or TextChunk, e.g. 'p. 3' or 'pp. 3-4'."""
+    if chunk.first_page == chunk.last_page:
+        return f"p. {chunk.first_page}"
+    return f"pp. {chunk.first_page}-{chunk.last_page}"
+
+
+def _iter_units(pages: Iterable[str], max_tokens: int) -> Iterator[_Unit]:
+    """Split a page stream into sentences, cutting any sentence longer than max_tokens."""
+    for page_no, page in enumerate(pages, start=1):
+        for paragraph in _PARAGRAPH_BREAK.split(page):
+            # PDF text wraps lines inside a paragraph; keep the words, drop the layout
+            paragraph = " ".join(paragraph.split())
+            starts_paragraph = True
+            for sentence in _SENTENCE_END.split(paragraph):
+                if not sentence:
+                    continue
+                tokens = _get_encoding().encode(sentence)
+                for start in range(0, len(tokens), max_tokens):
+                    piece = tokens[start:start + max_tokens]
+                    text = sentence if len(piece) == len(tokens) else _get_encoding().decode(piece)
+                    yield _Unit(text, page_no, len(piece), starts_paragraph)
+                    starts_paragraph = False
+
+
+def _size(units) -> int:
+    """Token count of units joined together, counting one token per separator."""
+    return sum(unit.tokens for unit in units) + max(len(units) - 1, 0)
+
+
+def _join_units(units) -> TextChunk:
+    parts = []
+    for i, unit in enumerate(units):
+        if i:
+            parts.append("\n\n" if unit.starts_paragraph else " ")
+        parts.append(unit.text)
+    return TextChunk("".join(parts), units[0].page, units[-1].page, _size(units))
+
+
+def _cut_point(buffer, fresh: int, max_tokens: int) -> int:
+    """
+    Where to end the next chunk: after the last paragraph that ends in the
+    second half of the buffer, else after the whole buffer. The cut always
+    keeps at least one unit not yet emitted.
+    """
+    first_fresh = len(buffer) - fresh
+    for i in range(len(buffer) - 1, first_fresh, -1):
+        if buffer[i].starts_paragraph and _size(buffer[:i]) >= max_tokens // 2:
+            return i
+    return len(buffer)
+
+
+def _overlap(emitted, budget: int):
+    """Whole trailing units of the emitted chunk that fit in the token budget."""
+    start = len(emitted)
+    while start > 0 and _size(emitted[start - 1:]) <= budget:
+        start -= 1
+    return emitted[start:]
+
+
+def iter_chunks(pages: Iterable[str], max_tokens: int = DEFAULT_MAX_TOKENS,
+                overlap_tokens: int = DEFAULT_OVERLAP_TOKENS) -> Iterator[TextChunk]:
+    """
+    Stream chunks of at most max_tokens (cl100k_base) from an iterable of page texts.
+
+    Chunks end on sentence boundaries, preferably on a paragraph boundary when
+    one falls in the second half of the chunk. Each chunk starts with up to
+    `overlap_tokens` of whole sentences from the end of the previous one.
+    Only the sentences of the chunk being built are held in memory, so pages
+    can come from a generator over an arbitrarily large document.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+    buffer = []
+    size = 0  # _size(buffer), kept up to date as units are appended
+    fresh = 0  # Trailing units of buffer that no emitted chunk contains yet
+    for unit in _iter_units(pages, max_tokens):
+        while fresh and size + 1 + unit.tokens > max_tokens:
+            cut = _cut_point(buffer, fresh, max_tokens)
+            emitted, rest = buffer[:cut], buffer[cut:]
+            yield _join_units(emitted)
+            buffer = _overlap(emitted, overlap_tokens) + rest
+            fresh = len(rest)
+            # Drop overlap that would leave no room for the next sentence
+            while len(buffer) > fresh and _size(buffer) + 1 + unit.tokens > max_tokens:
+                buffer.pop(0)
+            size = _size(buffer)
+        size += unit.tokens + (1 if buffer else 0)
+        buffer.append(unit)
+        fresh += 1
+    if fresh:
+        yield _join_units(buffer)
+
+
+class ChunkStore:
+    """
+    Persistent chunking stage. Chunks are stored per (document name, content
+    hash, chunker key), so a document is only re-chunked when it is renamed,
+    its content changes or the chunker settings change.
+    """
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS chunked (
+                doc TEXT NOT NULL, doc_sha256 TEXT NOT NULL, chunker TEXT NOT NULL, chunk_count INTEGER NOT NULL,
+                PRIMARY KEY (doc, doc_sha256, chunker)
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                doc TEXT NOT NULL, doc_sha256 TEXT NOT NULL, chunker TEXT NOT NULL, idx INTEGER NOT NULL,
+                chunk_id TEXT NOT NULL, text TEXT NOT NULL, first_page INTEGER NOT NULL, last_page INTEGER NOT NULL,
+                PRIMARY KEY (doc, doc_sha256, chunker, idx)
+            );
+        """)
+        self._conn.commit()
+
+    def get_chunks(self, doc: str, doc_sha256: str, pages: List[str], chunker_key: str,
+                   chunker: Callable[[List[str]], Iterable[TextChunk]] = iter_chunks) -> List[Chunk]:
+        """Return the document's chunks, running `chunker` over its pages only on a cache miss."""
+        key = (doc, doc_sha256, chunker_key)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT chunk_count FROM chunked WHERE doc = ? AND doc_sha256 = ? AND chunker = ?", key
+            ).fetchone()
+            if row is not None:
+                stored = self._conn.execute(
+                    "SELECT chunk_id, idx, text, first_page, last_page FROM chunks"
+                    " WHERE doc = ? AND doc_sha256 = ? AND chunker = ? ORDER BY idx",
+                    key,
+                ).fetchall()
+                if len(stored) == row[0]:
+                    return [Chunk(chunk_id, doc, *rest) for chunk_id, *rest in stored]
+
+        chunks = [Chunk(make_chunk_id(doc, piece.text), doc, idx, piece.text, piece.first_page, piece.last_page)
+                  for idx, piece in enumerate(chunker(pages))]
+        with self._lock:
+            # Older versions of this document no longer need their chunks
+            self._conn.execute("DELETE FROM chunks WHERE doc = ? AND chunker = ?", (doc, chunker_key))
+            self._conn.execute("DELETE FROM chunked WHERE doc = ? AND chunker = ?", (doc, chunker_key))
+            self._conn.executemany(
+                "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [(doc, doc_sha256, chunker_key, chunk.index, chunk.id, chunk.text, chunk.first_page, chunk.last_page)
+                 for chunk in chunks],
+            )
+            self._conn.execute("INSERT INTO chunked VALUES (?, ?, ?, ?)", key + (len(chunks),))
+            self._conn.commit()
+        return chunks
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
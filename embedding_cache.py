@@ -0,0 +1,69 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+
+DEFAULT_DB_PATH = os.environ.get("EMBEDDING_CACHE_DB", "embedding_cache.sqlite3")
+
+
+class EmbeddingCache:
+    """Persistent embedding store keyed by a hash of (model, text)."""
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, dim INTEGER NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Content hash used as the cache key."""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Return the cached float32 vector, or None on a miss."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (self.make_key(model, text),)
+            ).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """Return {text: vector} for every text that is already cached."""
+        keys = {self.make_key(model, text): text for text in texts}
+        key_list = list(keys)
+        found = {}
+        with self._lock:
+            # Stay under SQLite's bound-parameter limit on large stores
+            for start in range(0, len(key_list), 500):
+                batch = key_list[start:start + 500]
+                for key, vector in self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ):
+                    found[keys[key]] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put(self, model: str, text: str, vector) -> None:
+        """Store one embedding."""
+        self.put_many(model, {text: vector})
+
+    def put_many(self, model: str, vectors: Dict[str, "np.ndarray"]) -> None:
+        """Store several embeddings in one transaction."""
+        rows = []
+        for text, vector in vectors.items():
+            vector = np.asarray(vector, dtype=np.float32)
+            rows.append((self.make_key(model, text), vector.shape[0], vector.tobytes()))
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,250 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional
+from urllib.request import pathname2url
+
+import fitz  # PyMuPDF
+
+DEFAULT_DB_PATH = os.environ.get("PDF_CACHE_DB", "pdf_text_cache.sqlite3")
+
+# pages: list of per-page text, in page order
+ExtractedPdf = namedtuple("ExtractedPdf", ["path", "sha256", "pages"])
+# One file's outcome from ingest_pdfs(): document is None when error is set
+IngestResult = namedtuple("IngestResult", ["path", "document", "seconds", "error", "cached"])
+
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    """Hash a file's bytes without reading it into memory at once."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract_pages(path: str) -> List[str]:
+    """Extract per-page text with PyMuPDF (no caching)."""
+    with fitz.open(path) as doc:
+        return [page.get_text() for page in doc]
+
+
+class PdfTextCache:
+    """
+    On-disk cache of extracted PDF text.
+
+    Files are matched by path, size and mtime first; if those changed the
+    content hash decides whether the file really needs re-extracting. Page
+    text is stored zlib-compressed and keyed by content hash, so a renamed or
+    copied PDF is never extracted twice.
+    """
+    def __init__(self, db_path: str = DEFAULT_DB_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS contents (sha256 TEXT PRIMARY KEY, page_count INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS pages (
+                sha256 TEXT NOT NULL, page_no INTEGER NOT NULL, text BLOB NOT NULL, PRIMARY KEY (sha256, page_no)
+            );
+        """)
+        self._conn.commit()
+
+    def lookup(self, path: str) -> Optional[ExtractedPdf]:
+        """Return the cached extraction if the file is unchanged, else None. Never parses the PDF."""
+        cached = self.lookup_unchanged(path)
+        if cached is not None:
+            return cached
+        # Size or mtime changed (or new path): the content hash decides
+        return self.adopt(path, file_sha256(path))
+
+    def lookup_unchanged(self, path: str) -> Optional[ExtractedPdf]:
+        """Like lookup(), but only by path, size and mtime: never reads the file."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, sha256 FROM documents WHERE path = ?", (path,)
+            ).fetchone()
+        if row is None or row[0] != stat.st_size or row[1] != stat.st_mtime_ns:
+            return None
+        pages = self._load_pages(row[2])
+        return None if pages is None else ExtractedPdf(path, row[2], pages)
+
+    def adopt(self, path: str, sha256: str) -> Optional[ExtractedPdf]:
+        """Reuse the pages cached for this content hash under a new or changed path, else None."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        pages = self._load_pages(sha256)
+        if pages is None:
+            return None
+        self._remember(path, stat, sha256)
+        return ExtractedPdf(path, sha256, pages)
+
+    def store(self, path: str, pages: List[str], sha256: Optional[str] = None) -> ExtractedPdf:
+        """Save freshly extracted pages for a file."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        sha256 = sha256 or file_sha256(path)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO contents VALUES (?, ?)", (sha256, len(pages)))
+            self._conn.execute("DELETE FROM pages WHERE sha256 = ?", (sha256,))
+            self._conn.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?)",
+                [(sha256, page_no, zlib.compress(text.encode("utf-8"))) for page_no, text in enumerate(pages)],
+            )
+            self._conn.commit()
+        self._remember(path, stat, sha256)
+        return ExtractedPdf(path, sha256, pages)
+
+    def get(self, path: str) -> ExtractedPdf:
+        """Return the file's pages, extracting and caching them only if the file changed."""
+        cached = self.lookup(path)
+        if cached is not None:
+            return cached
+        return self.store(path, extract_pages(path))
+
+    def prune(self) -> None:
+        """Drop cached entries for files that no longer exist and page text nobody references."""
+        with self._lock:
+            paths = [row[0] for row in self._conn.execute("SELECT path FROM documents")]
+            gone = [(path,) for path in paths if not os.path.exists(path)]
+            self._conn.executemany("DELETE FROM documents WHERE path = ?", gone)
+            self._conn.execute("DELETE FROM contents WHERE sha256 NOT IN (SELECT sha256 FROM documents)")
+            self._conn.execute("DELETE FROM pages WHERE sha256 NOT IN (SELECT sha256 FROM contents)")
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _load_pages(self, sha256: str) -> Optional[List[str]]:
+        with self._lock:
+            row = self._conn.execute("SELECT page_count FROM contents WHERE sha256 = ?", (sha256,)).fetchone()
+            if row is None:
+                return None
+            blobs = [blob for (blob,) in self._conn.execute(
+                "SELECT text FROM pages WHERE sha256 = ? ORDER BY page_no", (sha256,)
+            )]
+        if len(blobs) != row[0]:
+            return None
+        return [zlib.decompress(blob).decode("utf-8") for blob in blobs]
+
+    def _remember(self, path: str, stat: os.stat_result, sha256: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, sha256),
+            )
+            self._conn.commit()
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_cache() -> PdfTextCache:
+    """Process-wide cache at DEFAULT_DB_PATH, opened on first use."""
+    global _default_cache
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = PdfTextCache()
+    return _default_cache
+
+
+def get_document(path: str) -> ExtractedPdf:
+    """Cached per-page extraction of one PDF."""
+    return default_cache().get(path)
+
+
+def get_text(path: str) -> str:
+    """Cached full text of one PDF (pages joined once, not concatenated in a loop)."""
+    return "".join(get_document(path).pages)
+
+
+def _extract_in_worker(path: str, db_path: str):
+    """
+    Process-pool task: hash one file and extract it unless the cache already
+    has its content (pages is then None). Reports failures instead of raising.
+    """
+    start = time.perf_counter()
+    try:
+        sha256 = file_sha256(path)
+        try:
+            conn = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_path))}?mode=ro", uri=True)
+            try:
+                cached = conn.execute("SELECT 1 FROM contents WHERE sha256 = ?", (sha256,)).fetchone() is not None
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            cached = False
+        pages = None if cached else extract_pages(path)
+        return path, sha256, pages, time.perf_counter() - start, None
+    except Exception as e:
+        return path, None, None, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+
+
+def ingest_pdfs(paths: Iterable[str], max_workers: Optional[int] = None, max_pending: Optional[int] = None,
+                cache: Optional[PdfTextCache] = None) -> Iterator[IngestResult]:
+    """
+    Yield one IngestResult per PDF as soon as it is ready.
+
+    Files whose path, size and mtime are unchanged are served from the cache
+    straight away. Changed or new files go to a process pool across all
+    cores, which hashes them and extracts only content the cache lacks. At most `max_pending` files (default
+    2 per worker) are in flight or finished-but-unconsumed, so a slow
+    consumer throttles extraction and memory stays bounded. Only this
+    process writes to the cache.
+    """
+    cache = cache or default_cache()
+    max_workers = max_workers or os.cpu_count() or 1
+    max_pending = max_pending or 2 * max_workers
+
+    misses = []
+    for path in paths:
+        start = time.perf_counter()
+        try:
+            document = cache.lookup_unchanged(path)
+        except OSError as e:
+            yield IngestResult(path, None, time.perf_counter() - start, f"{type(e).__name__}: {e}", False)
+            continue
+        if document is None:
+            misses.append(path)
+        else:
+            yield IngestResult(path, document, time.perf_counter() - start, None, True)
+    if not misses:
+        return
+
+    remaining = iter(misses)
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(misses))) as pool:
+        in_flight = set()
+        for path in remaining:
+            in_flight.add(pool.submit(_extract_in_worker, path, cache.db_path))
+            if len(in_flight) >= max_pending:
+                break
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                path, sha256, pages, seconds, error = future.result()
+                if error is None:
+                    # A renamed or touched file whose content is already cached only needs its new path recorded
+                    document = cache.adopt(path, sha256) if pages is None else None
+                    if document is not None:
+                        yield IngestResult(path, document, seconds, None, True)
+                    else:
+                        document = cache.store(path, pages if pages is not None else extract_pages(path), sha256)
+                        yield IngestResult(path, document, seconds, None, False)
+                else:
+                    yield IngestResult(path, None, seconds, error, False)
+                next_path = next(remaining, None)
+                if next_path is not None:
+                    in_flight.add(pool.submit(_extract_in_worker, next_path, cache.db_path))
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+import api_client
+from embedding_cache import EmbeddingCache
+from vector_index import FlatIndex
+
+DEFAULT_DB_PATH = os.environ.get("SEMANTIC_CACHE_DB", "semantic_cache.sqlite3")
+# Cosine similarity. ada-002 scores even unrelated English text around 0.7 and different questions
+# on one topic ("vacation days" vs "sick days") can pass 0.9, so only near-paraphrases should clear
+# this. 0.97 is a conservative pick, not a measured one: tune it against logged question pairs.
+DEFAULT_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+DEFAULT_EMBEDDING_MODEL = "text-embedding-ada-002"
+
+# An embedding failure only costs the cache lookup, never the answer
+EMBEDDING_ERRORS = api_client.REQUEST_ERRORS + (KeyError, ValueError)
+
+
+def folder_version(folder: str, suffix: str = ".pdf") -> str:
+    """Fingerprint of a documents folder: changes when a file is added, removed, replaced or edited."""
+    entries = []
+    if os.path.isdir(folder):
+        for filename in sorted(os.listdir(folder)):
+            path = os.path.join(folder, filename)
+            if filename.endswith(suffix) and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append([filename, stat.st_size, stat.st_mtime_ns])
+    return hashlib.sha256(json.dumps(entries).encode("utf-8")).hexdigest()
+
+
+def make_api_embedder(url: str, headers: dict, model: str = DEFAULT_EMBEDDING_MODEL,
+                      cache: Optional[EmbeddingCache] = None) -> Callable[[str], np.ndarray]:
+    """Embed one text through the embeddings endpoint, reusing vectors from the EmbeddingCache."""
+    cache = cache or EmbeddingCache()
+
+    def embed(text: str) -> np.ndarray:
+        vector = cache.get(model, text)
+        if vector is None:
+            response = api_client.post(url, headers=headers, data=json.dumps({"model": model, "input": text}))
+            response.raise_for_status()
+            vector = np.asarray(response.json()["data"][0]["embedding"], dtype=np.float32)
+            cache.put(model, text, vector)
+        return vector
+
+    return embed
+
+
+class SemanticCache:
+    """
+    Answers to earlier questions, found again by meaning rather than exact text.
+
+    A question is embedded and compared with the questions already answered
+    for the same document-set `version`; the stored answer of the closest
+    one is returned if its cosine similarity reaches `threshold`. Entries for
+    any other version are deleted when the cache is opened, so changing the
+    documents invalidates every answer given from the old ones. Past
+    `max_entries` the least recently used answers are evicted. If a question
+    cannot be embedded, lookup() misses and store() does nothing.
+    """
+    def __init__(self, embed: Callable[[str], np.ndarray], version: str, db_path: str = DEFAULT_DB_PATH,
+                 threshold: float = DEFAULT_THRESHOLD, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.embed = embed
+        self.version = version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT NOT NULL, question TEXT NOT NULL,
+                answer TEXT NOT NULL, embedding BLOB NOT NULL, last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_question ON answers (version, question)")
+        self._conn.execute("DELETE FROM answers WHERE version != ?", (version,))
+        self._conn.commit()
+        self._index: Optional[FlatIndex] = None
+        self._row_ids: List[int] = []
+        self._rebuild_index()
+
+    def __len__(self) -> int:
+        return len(self._row_ids)
+
+    def lookup(self, question: str) -> Optional[Tuple[str, str, float]]:
+        """Return (stored answer, matched question, similarity) for the closest earlier question, or None."""
+        vector = self._embed(question)
+        with self._lock:
+            if vector is None or self._index is None or len(self._index) == 0:
+                self.misses += 1
+                return None
+            ids, scores = self._index.search(vector, k=1)
+            if scores[0] < self.threshold:
+                self.misses += 1
+                return None
+            row_id = self._row_ids[ids[0]]
+            matched_question, answer = self._conn.execute(
+                "SELECT question, answer FROM answers WHERE id = ?", (row_id,)
+            ).fetchone()
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), row_id))
+            self._conn.commit()
+            self.hits += 1
+        return answer, matched_question, float(scores[0])
+
+    def store(self, question: str, answer: str) -> None:
+        """Remember the answer to a question for the current document-set version."""
+        with self._lock:
+            # The same question text asked again replaces its answer rather than adding a tied duplicate
+            cursor = self._conn.execute(
+                "UPDATE answers SET answer = ?, last_used = ? WHERE version = ? AND question = ?",
+                (answer, time.time(), self.version, question),
+            )
+            self._conn.commit()
+            if cursor.rowcount:
+                return
+        vector = self._embed(question)
+        if vector is None:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO answers (version, question, answer, embedding, last_used) VALUES (?, ?, ?, ?, ?)",
+                (self.version, question, answer, vector.tobytes(), time.time()),
+            )
+            self._conn.commit()
+            if self._index is None:
+                self._index = FlatIndex(vector.shape[0])
+            self._index.add(vector)
+            self._row_ids.append(cursor.lastrowid)
+            if len(self._row_ids) > self.max_entries:
+                self._evict()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _embed(self, question: str) -> Optional[np.ndarray]:
+        try:
+            return np.asarray(self.embed(question), dtype=np.float32)
+        except EMBEDDING_ERRORS as e:
+            print(f"Semantic cache skipped, embedding failed: {e}")
+            return None
+
+    def _evict(self) -> None:
+        # Drop down to 90% of capacity so eviction (and the index rebuild) is not paid on every store
+        keep = int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM answers WHERE id NOT IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT ?)", (keep,)
+        )
+        self._conn.commit()
+        self._rebuild_index()
+
+    def _rebuild_index(self) -> None:
+        rows = self._conn.execute("SELECT id, embedding FROM answers ORDER BY id").fetchall()
+        self._row_ids = [row_id for row_id, _ in rows]
+        self._index = None
+        if rows:
+            vectors = np.stack([np.frombuffer(blob, dtype=np.float32) for _, blob in rows])
+            self._index = FlatIndex(vectors.shape[1])
+            self._index.add(vectors)
@@ -0,0 +1,338 @@
+import json
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from vector_index import top_k as _top_k
+
+# Same tokenization as scikit-learn's TfidfVectorizer defaults, so queries can
+# be vectorized without importing scikit-learn
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+MANIFEST_FILE = "manifest.json"
+VOCABULARY_FILE = "vocabulary.json"
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+# Scoring below walks inverted lists: a term-major (CSC) matrix whose column t
+# holds (chunk id, weight) for every chunk containing term t. Only the lists of
+# the query's terms are touched, and scores are kept as (chunk ids, scores)
+# pairs, never as a dense array over the whole corpus.
+
+_NO_HITS = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+
+
+def _postings_of(postings: sparse.csc_matrix, column: int, weight: float) -> Tuple[np.ndarray, np.ndarray]:
+    start, end = postings.indptr[column], postings.indptr[column + 1]
+    return postings.indices[start:end], postings.data[start:end] * weight
+
+
+def accumulate(postings: sparse.csc_matrix, columns: np.ndarray, weights: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Exhaustive term-at-a-time scoring: (chunk ids, scores) of every chunk sharing a term with the query."""
+    hits = [_postings_of(postings, column, weight) for column, weight in zip(columns, weights)]
+    if not hits:
+        return _NO_HITS
+    ids, inverse = np.unique(np.concatenate([ids for ids, _ in hits]), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate([contributions for _, contributions in hits]))
+    return ids, scores.astype(np.float32)
+
+
+def maxscore_top_k(postings: sparse.csc_matrix, term_max: np.ndarray, columns: np.ndarray,
+                   weights: np.ndarray, k: int, threshold: float = 0.0) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact top-k (chunk ids, scores), best first, by term-at-a-time MaxScore.
+
+    Terms are visited in decreasing order of their largest possible
+    contribution (query weight x the term's largest chunk weight). As soon as
+    the k-th best score so far (or `threshold`) beats everything the unvisited
+    terms could still add, no unseen chunk can reach the top k: the remaining
+    lists only update chunks already accumulated, and chunks that can no
+    longer reach the cut-off are dropped along the way.
+    """
+    if k <= 0 or columns.size == 0:
+        return _NO_HITS
+    bounds = weights.astype(np.float64) * term_max[columns]
+    order = np.argsort(-bounds)
+    # remaining[i]: the most that terms order[i:] can add to any chunk
+    remaining = np.append(np.cumsum(bounds[order][::-1])[::-1], 0.0)
+    ids, scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    accepting_new = True
+    for i, term in enumerate(order):
+        term_ids, contributions = _postings_of(postings, columns[term], weights[term])
+        if accepting_new:
+            ids, inverse = np.unique(np.concatenate([ids, term_ids]), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate([scores, contributions]))
+        else:
+            positions = np.minimum(np.searchsorted(ids, term_ids), ids.size - 1)
+            found = ids[positions] == term_ids
+            scores[positions[found]] += contributions[found]
+
+        cutoff = threshold
+        if scores.size >= k:
+            cutoff = max(cutoff, np.partition(scores, scores.size - k)[scores.size - k])
+        if cutoff > remaining[i + 1]:
+            accepting_new = False
+            reachable = scores + remaining[i + 1] >= cutoff
+            ids, scores = ids[reachable], scores[reachable]
+            if ids.size == 0:
+                return _NO_HITS
+
+    above = scores >= threshold
+    ids, scores = ids[above], scores[above]
+    best = _top_k(scores, k)
+    return ids[best], scores[best].astype(np.float32)
+
+
+def _column_max(postings: sparse.csc_matrix) -> np.ndarray:
+    """Largest weight in each inverted list (0 for empty lists): the MaxScore upper bounds."""
+    term_max = np.zeros(postings.shape[1], dtype=np.float32)
+    lengths = np.diff(postings.indptr)
+    non_empty = np.flatnonzero(lengths)
+    if non_empty.size:
+        term_max[non_empty] = np.maximum.reduceat(postings.data, postings.indptr[non_empty])
+    return term_max
+
+
+class TfidfIndex:
+    """
+    TF-IDF chunk index that is fitted offline and loaded by memory-mapping.
+
+    On disk: the CSR arrays of the L2-normalized chunk matrix and the idf
+    weights as .npy files, the vocabulary as JSON, and the chunk texts as one
+    UTF-8 blob plus an offsets array. The same matrix is also saved term-major
+    (the inverted lists search() walks) with each term's largest weight.
+    Loading reads the vocabulary and maps everything else, so start-up cost
+    does not grow with the corpus.
+    """
+    def __init__(self, vocabulary: dict, idf: np.ndarray, matrix: sparse.csr_matrix,
+                 text_blob: np.ndarray, text_offsets: np.ndarray, manifest: Optional[dict] = None,
+                 postings: Optional[sparse.csc_matrix] = None, term_max: Optional[np.ndarray] = None):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix
+        self._text_blob = text_blob
+        self._text_offsets = text_offsets
+        self.manifest = manifest or {}
+        # Indexes saved before the inverted lists existed derive them on load
+        self.postings = postings if postings is not None else matrix.tocsc()
+        self.term_max = term_max if term_max is not None else _column_max(self.postings)
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    @classmethod
+    def build(cls, chunks: List[str], **manifest) -> "TfidfIndex":
+        """Fit TF-IDF over the chunks (the slow step; run it from the build command)."""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(token_pattern=TOKEN_PATTERN.pattern, dtype=np.float32)
+        matrix = vectorizer.fit_transform(chunks).tocsr()
+        encoded = [chunk.encode("utf-8") for chunk in chunks]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        vocabulary = {term: int(column) for term, column in vectorizer.vocabulary_.items()}
+        return cls(vocabulary, vectorizer.idf_.astype(np.float32), matrix, blob, offsets, manifest)
+
+    def save(self, index_dir: str) -> None:
+        os.makedirs(index_dir, exist_ok=True)
+        arrays = {
+            "data": self.matrix.data, "indices": self.matrix.indices, "indptr": self.matrix.indptr,
+            "idf": self.idf, "text_blob": self._text_blob, "text_offsets": self._text_offsets,
+            "postings_data": self.postings.data, "postings_indices": self.postings.indices,
+            "postings_indptr": self.postings.indptr, "term_max": self.term_max,
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(index_dir, f"{name}.npy"), array)
+        with open(os.path.join(index_dir, VOCABULARY_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.vocabulary, f, ensure_ascii=False)
+        # Written last: an index directory without a manifest is incomplete
+        manifest = dict(self.manifest, shape=list(self.matrix.shape))
+        with open(os.path.join(index_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+
+    @classmethod
+    def load(cls, index_dir: str) -> "TfidfIndex":
+        """Open a saved index; array files are memory-mapped read-only."""
+        with open(os.path.join(index_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(os.path.join(index_dir, VOCABULARY_FILE), encoding="utf-8") as f:
+            vocabulary = json.load(f)
+
+        def mapped(name):
+            return np.load(os.path.join(index_dir, f"{name}.npy"), mmap_mode="r")
+
+        shape = tuple(manifest["shape"])
+        matrix = sparse.csr_matrix((mapped("data"), mapped("indices"), mapped("indptr")), shape=shape, copy=False)
+        postings = term_max = None
+        if os.path.exists(os.path.join(index_dir, "term_max.npy")):
+            postings = sparse.csc_matrix(
+                (mapped("postings_data"), mapped("postings_indices"), mapped("postings_indptr")), shape=shape, copy=False
+            )
+            term_max = mapped("term_max")
+        return cls(vocabulary, mapped("idf"), matrix, mapped("text_blob"), mapped("text_offsets"), manifest,
+                   postings, term_max)
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, MANIFEST_FILE))
+
+    def chunk(self, chunk_id: int) -> str:
+        start, end = self._text_offsets[chunk_id], self._text_offsets[chunk_id + 1]
+        return bytes(self._text_blob[start:end]).decode("utf-8")
+
+    def transform(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorize a query like the fitted TfidfVectorizer would: (term columns, L2-normalized weights)."""
+        counts = Counter(self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary)
+        if not counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        columns = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float32, count=len(counts)) * self.idf[columns]
+        return columns, weights / np.linalg.norm(weights)
+
+    def search(self, query: str, top_k: int = 3, threshold: float = 0.0,
+               prune: bool = True) -> List[Tuple[int, float]]:
+        """
+        Return [(chunk id, cosine similarity)] for the `top_k` best chunks
+        scoring at least `threshold`, best first. `prune=False` scores every
+        chunk that shares a term with the query instead of using MaxScore;
+        the results are the same.
+        """
+        columns, weights = self.transform(query)
+        if prune:
+            ids, scores = maxscore_top_k(self.postings, self.term_max, columns, weights, top_k, threshold)
+        else:
+            ids, scores = accumulate(self.postings, columns, weights)
+            above = scores >= threshold
+            ids, scores = ids[above], scores[above]
+            best = _top_k(scores, top_k)
+            ids, scores = ids[best], scores[best]
+        return [(int(chunk_id), float(score)) for chunk_id, score in zip(ids, scores)]
+
+
+class SparseChunkIndex:
+    """
+    Incrementally updatable TF-IDF index over the chunks of many documents.
+
+    Chunks are stored as hashed raw term counts (no fitted vocabulary), with a
+    document-id column, so adding or removing a document never refits the
+    chunks already indexed. idf comes from the live document frequencies at
+    query time and is applied on the query side; chunk norms are recomputed
+    lazily after the corpus changes, so scores equal TF-IDF cosine similarity.
+    """
+    def __init__(self, n_features: int = 2 ** 20):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features, token_pattern=TOKEN_PATTERN.pattern,
+            alternate_sign=False, norm=None, dtype=np.float32,
+        )
+        self.n_features = n_features
+        self.doc_names: List[str] = []
+        self.chunks: List[str] = []
+        self.doc_ids = np.empty(0, dtype=np.int32)
+        self._live = np.empty(0, dtype=bool)
+        self._blocks: List[sparse.csr_matrix] = []
+        self._df = np.zeros(n_features, dtype=np.int64)
+        self._matrix: Optional[sparse.csr_matrix] = None
+        self._postings: Optional[sparse.csc_matrix] = None
+        self._norms: Optional[np.ndarray] = None
+
+    def __len__(self) -> int:
+        return int(self._live.sum())
+
+    def add_document(self, name: str, chunks: List[str]) -> int:
+        """Index a document's chunks (replacing any document with the same name) and return its id."""
+        if name in self.doc_names:
+            self.remove_document(name)
+        doc_id = len(self.doc_names)
+        self.doc_names.append(name)
+        counts = self._vectorizer.transform(chunks).tocsr()
+        self._blocks.append(counts)
+        self._df += np.bincount(counts.indices, minlength=self.n_features)
+        self.chunks.extend(chunks)
+        self.doc_ids = np.concatenate([self.doc_ids, np.full(len(chunks), doc_id, dtype=np.int32)])
+        self._live = np.concatenate([self._live, np.ones(len(chunks), dtype=bool)])
+        self._matrix = None
+        self._postings = None
+        self._norms = None
+        return doc_id
+
+    def remove_document(self, name: str) -> None:
+        """Drop a document from scoring; its rows stay in storage but never match again."""
+        doc_id = self.doc_names.index(name)
+        rows = np.flatnonzero((self.doc_ids == doc_id) & self._live)
+        if rows.size:
+            counts = self._stacked()[rows]
+            self._df -= np.bincount(counts.indices, minlength=self.n_features)
+            self._live[rows] = False
+            self._norms = None
+        self.doc_names[doc_id] = None
+
+    def _stacked(self) -> sparse.csr_matrix:
+        if self._matrix is None:
+            self._matrix = sparse.vstack(self._blocks, format="csr") if self._blocks else \
+                sparse.csr_matrix((0, self.n_features), dtype=np.float32)
+            self._blocks = [self._matrix]
+        return self._matrix
+
+    def idf(self) -> np.ndarray:
+        """Smoothed idf over live chunks, matching TfidfVectorizer(smooth_idf=True)."""
+        n_chunks = len(self)
+        return (np.log((1 + n_chunks) / (1 + self._df)) + 1).astype(np.float32)
+
+    def scores(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        TF-IDF cosine similarity of the query as (chunk ids, scores), for the
+        live chunks that share a term with it. Only the query terms' inverted
+        lists are read.
+        """
+        matrix = self._stacked()
+        idf = self.idf()
+        if self._postings is None:
+            self._postings = matrix.tocsc()
+        if self._norms is None:
+            squared = matrix.multiply(matrix) @ (idf * idf)
+            self._norms = np.sqrt(squared).astype(np.float32)
+            self._norms[(self._norms == 0) | ~self._live] = np.inf
+        query_counts = self._vectorizer.transform([query])
+        columns = query_counts.indices
+        weights = query_counts.data * idf[columns]
+        norm = np.linalg.norm(weights)
+        if norm == 0:
+            return _NO_HITS
+        # chunk . query with idf on both sides == counts . (query weights * idf)
+        ids, scores = accumulate(self._postings, columns, weights * idf[columns] / norm)
+        scores /= self._norms[ids]
+        live = scores > 0
+        return ids[live], scores[live]
+
+    def search_per_document(self, query: str, top_k: int = 1,
+                            threshold: float = 0.0) -> Dict[str, List[Tuple[float, str]]]:
+        """
+        Score the query once against every chunk and return each live
+        document's best `top_k` chunks as {name: [(score, chunk)]}, best first.
+        Chunks scoring below `threshold` are left out.
+        """
+        ids, scores = self.scores(query)
+        above = scores >= threshold
+        ids, scores = ids[above], scores[above]
+        results = {name: [] for name in self.doc_names if name is not None}
+        if ids.size == 0:
+            return results
+        # Group candidates by document, best score first within each group
+        order = np.lexsort((-scores, self.doc_ids[ids]))
+        groups = self.doc_ids[ids[order]]
+        group_starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+        rank = np.arange(order.size) - np.repeat(group_starts, np.diff(np.r_[group_starts, order.size]))
+        for position in order[rank < top_k]:
+            row = ids[position]
+            results[self.doc_names[self.doc_ids[row]]].append((float(scores[position]), self.chunks[row]))
+        return results
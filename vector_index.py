@@ -0,0 +1,279 @@
+import logging
+from typing import Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib  # Optional: only needed for HNSWIndex (pip install hnswlib)
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Every index stores L2-normalized float32 vectors, so the inner product is the
+# cosine similarity. Vector ids are insertion positions: 0, 1, 2, ...
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Return float32 copies of the rows scaled to unit length."""
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k largest scores, best first, without a full sort."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1)[:k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class _GrowableMatrix:
+    """Row-appendable float32 matrix with amortized O(1) appends."""
+    def __init__(self, dim: int, capacity: int = 1024):
+        self._data = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+
+    def append(self, rows: np.ndarray) -> None:
+        needed = self.size + rows.shape[0]
+        if needed > self._data.shape[0]:
+            grown = np.empty((max(needed, 2 * self._data.shape[0]), self._data.shape[1]), dtype=np.float32)
+            grown[:self.size] = self._data[:self.size]
+            self._data = grown
+        self._data[self.size:needed] = rows
+        self.size = needed
+
+    @property
+    def view(self) -> np.ndarray:
+        return self._data[:self.size]
+
+
+class _VectorRows:
+    """
+    The unit-length rows an index searches: an optional read-only `base`
+    matrix (typically a memmap) scaled on the fly by its precomputed row
+    norms, followed by appended rows stored already normalized. The base is
+    never copied, so an index over an existing store costs nothing to open.
+    """
+    def __init__(self, dim: int, base: Optional[np.ndarray] = None, base_norms: Optional[np.ndarray] = None):
+        if base is None:
+            base = np.empty((0, dim), dtype=np.float32)
+            base_norms = np.empty(0, dtype=np.float32)
+        if base_norms is None or len(base_norms) != len(base):
+            raise ValueError("base_norms must hold one norm per base row")
+        self._base = base
+        norms = np.asarray(base_norms, dtype=np.float32)
+        self._inverse_norms = np.divide(1.0, norms, out=np.ones_like(norms), where=norms != 0)
+        self._tail = _GrowableMatrix(dim)
+
+    def __len__(self) -> int:
+        return len(self._base) + self._tail.size
+
+    def append(self, normalized: np.ndarray) -> None:
+        self._tail.append(normalized)
+
+    def scores(self, query: np.ndarray) -> np.ndarray:
+        """Cosine similarity of every row with a normalized query."""
+        if not len(self._base):
+            return self._tail.view @ query
+        return np.concatenate([(self._base @ query) * self._inverse_norms, self._tail.view @ query])
+
+    def rows(self, ids: np.ndarray) -> np.ndarray:
+        """Normalized copies of the given rows."""
+        in_base = ids < len(self._base)
+        out = np.empty((len(ids), self._tail.view.shape[1]), dtype=np.float32)
+        base_ids = ids[in_base]
+        out[in_base] = self._base[base_ids] * self._inverse_norms[base_ids, None]
+        out[~in_base] = self._tail.view[ids[~in_base] - len(self._base)]
+        return out
+
+
+class FlatIndex:
+    """
+    Exact search: one matrix-vector product over every stored vector.
+
+    `base` / `base_norms` start the index over an existing matrix and its row
+    norms without copying or normalizing it (see _VectorRows).
+    """
+    def __init__(self, dim: int, base: Optional[np.ndarray] = None, base_norms: Optional[np.ndarray] = None):
+        self.dim = dim
+        self._vectors = _VectorRows(dim, base, base_norms)
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Append vectors; they get the next consecutive ids."""
+        self._vectors.append(normalize(vectors))
+
+    def search(self, query: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the k most similar vectors, best first."""
+        scores = self._vectors.scores(normalize(query)[0])
+        ids = top_k(scores, k)
+        return ids, scores[ids]
+
+
+class IVFIndex:
+    """
+    Inverted-file approximate index: vectors are bucketed under their nearest
+    k-means centroid and a query only scans the `n_probe` closest buckets.
+
+    Recall/latency knobs: raise `n_probe` (or lower `n_lists`) for recall,
+    lower it for speed. Until `train_size` vectors have been added the index
+    answers exactly, then it trains its centroids once and buckets everything.
+
+    An index over an existing `base` matrix (see FlatIndex) can be restored
+    without retraining by passing the `centroids` and per-vector `labels`
+    saved from a trained index.
+    """
+    ASSIGN_BATCH = 65536  # Rows normalized at a time while bucketing
+
+    def __init__(self, dim: int, n_lists: int = 256, n_probe: int = 8,
+                 train_size: Optional[int] = None, kmeans_iterations: int = 10, seed: int = 0,
+                 base: Optional[np.ndarray] = None, base_norms: Optional[np.ndarray] = None,
+                 centroids: Optional[np.ndarray] = None, labels: Optional[np.ndarray] = None):
+        self.dim = dim
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.train_size = train_size or n_lists * 39
+        self.kmeans_iterations = kmeans_iterations
+        self._rng = np.random.default_rng(seed)
+        self._vectors = _VectorRows(dim, base, base_norms)
+        self.centroids: Optional[np.ndarray] = None
+        self._lists = []
+        self._labels = np.empty(0, dtype=np.int64)  # Bucket of every vector by id, with spare capacity
+        self._labelled = 0
+        if centroids is not None and labels is not None and len(labels) == len(self._vectors):
+            self.centroids = np.asarray(centroids, dtype=np.float32)
+            self._lists = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+            self._add_to_lists(np.arange(len(labels)), np.asarray(labels, dtype=np.int64))
+        elif len(self._vectors) >= self.train_size:
+            self.train()
+
+    def __len__(self) -> int:
+        return len(self._vectors)
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def labels(self) -> np.ndarray:
+        """Bucket of every vector, by id (empty until trained)."""
+        return self._labels[:self._labelled]
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Append vectors; they get the next consecutive ids."""
+        vectors = normalize(vectors)
+        first_id = len(self._vectors)
+        self._vectors.append(vectors)
+        if self.is_trained:
+            self._assign(np.arange(first_id, len(self._vectors)), vectors)
+        elif len(self._vectors) >= self.train_size:
+            self.train()
+
+    def train(self) -> None:
+        """Fit the centroids with spherical k-means and bucket every stored vector."""
+        total = len(self._vectors)
+        n_lists = min(self.n_lists, total)
+        sample_ids = np.arange(total)
+        if total > n_lists * 256:
+            sample_ids = np.sort(self._rng.choice(total, n_lists * 256, replace=False))
+        sample = self._vectors.rows(sample_ids)
+        centroids = sample[self._rng.choice(sample.shape[0], n_lists, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            empty = np.bincount(labels, minlength=n_lists) == 0
+            sums[empty] = centroids[empty]  # Keep empty clusters where they were
+            centroids = normalize(sums)
+        self.centroids = centroids
+        self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+        self._labelled = 0
+        for start in range(0, total, self.ASSIGN_BATCH):
+            ids = np.arange(start, min(start + self.ASSIGN_BATCH, total))
+            self._assign(ids, self._vectors.rows(ids))
+        logger.info(f"Trained IVF index: {n_lists} lists over {total} vectors")
+
+    def _assign(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        self._add_to_lists(ids, np.argmax(vectors @ self.centroids.T, axis=1))
+
+    def _add_to_lists(self, ids: np.ndarray, labels: np.ndarray) -> None:
+        needed = self._labelled + len(labels)
+        if needed > len(self._labels):
+            grown = np.empty(max(needed, 2 * len(self._labels)), dtype=np.int64)
+            grown[:self._labelled] = self._labels[:self._labelled]
+            self._labels = grown
+        self._labels[self._labelled:needed] = labels
+        self._labelled = needed
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(len(self._lists) + 1))
+        for list_id in np.unique(labels):
+            members = ids[order[bounds[list_id]:bounds[list_id + 1]]]
+            self._lists[list_id] = np.concatenate([self._lists[list_id], members])
+
+    def search(self, query: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the (approximately) k most similar vectors, best first."""
+        query = normalize(query)[0]
+        if not self.is_trained:
+            scores = self._vectors.scores(query)
+            ids = top_k(scores, k)
+            return ids, scores[ids]
+        probes = top_k(self.centroids @ query, self.n_probe)
+        candidates = np.concatenate([self._lists[p] for p in probes])
+        scores = self._vectors.rows(candidates) @ query
+        best = top_k(scores, k)
+        return candidates[best], scores[best]
+
+
+class HNSWIndex:
+    """
+    Graph-based approximate index backed by the optional `hnswlib` package.
+
+    Recall/latency knobs: `ef_search` at query time, `m` and `ef_construction`
+    at build time.
+    """
+    def __init__(self, dim: int, m: int = 16, ef_construction: int = 200, ef_search: int = 64,
+                 initial_capacity: int = 1024):
+        if hnswlib is None:
+            raise ImportError("HNSWIndex requires hnswlib (pip install hnswlib)")
+        self.dim = dim
+        self._index = hnswlib.Index(space="ip", dim=dim)
+        self._index.init_index(max_elements=initial_capacity, M=m, ef_construction=ef_construction)
+        self._index.set_ef(ef_search)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, vectors: np.ndarray) -> None:
+        """Append vectors; they get the next consecutive ids."""
+        vectors = normalize(vectors)
+        needed = self._size + vectors.shape[0]
+        if needed > self._index.get_max_elements():
+            self._index.resize_index(max(needed, 2 * self._index.get_max_elements()))
+        self._index.add_items(vectors, np.arange(self._size, needed))
+        self._size = needed
+
+    def search(self, query: np.ndarray, k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (ids, scores) of the (approximately) k most similar vectors, best first."""
+        k = min(k, self._size)
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        labels, distances = self._index.knn_query(normalize(query), k=k)
+        # hnswlib's "ip" distance is 1 - inner product
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+
+INDEX_TYPES = {"flat": FlatIndex, "ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def make_index(kind: str, dim: int, **params):
+    """Build an empty index by name: 'flat' (exact), 'ivf' or 'hnsw' (approximate)."""
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type {kind!r}; choose from {', '.join(INDEX_TYPES)}")
+    return INDEX_TYPES[kind](dim, **params)